@@ -1,15 +1,31 @@
 import os
+import threading
+import traceback
+from itertools import islice
 
 from anomalo_api import AnomaloTableSummary
 
+from adapters.http_client import HttpClient
+
 
 class AnomaloCatalogAdapter:
+    _http_client = None
+    _http_client_lock = threading.Lock()
+
     @classmethod
     def adapters(clas):
         return clas.__subclasses__()
 
     def __init__(self, args):
         self._args = args
+        # updates queued by `_queue_update()` and results of batches applied so far
+        self._batch_lock = threading.Lock()
+        self._pending_updates = []
+        self._batch_results = {}
+        # number of queued updates applied together; adapters that always batch may change it
+        self.batch_size = getattr(args, "batch_size", 0)
+        # SyncStateStore set by main when a state file is in use, for values cached across runs
+        self.sync_state = None
 
     def _get_or_throw(self, var_name: str) -> str:
         v = os.environ.get(var_name)
@@ -22,12 +38,113 @@ class AnomaloCatalogAdapter:
     def configure(self):
         print(f"Initializing {self.__class__.__name__} integration...")
 
+    @property
+    def http(self) -> HttpClient:
+        """HTTP client shared by all adapters, sized for the number of `--workers`"""
+        with AnomaloCatalogAdapter._http_client_lock:
+            if AnomaloCatalogAdapter._http_client is None:
+                workers = getattr(self._args, "workers", 1)
+                AnomaloCatalogAdapter._http_client = HttpClient(
+                    pool_size=max(16, workers * 2),
+                    max_requests_per_host=max(8, workers),
+                )
+            return AnomaloCatalogAdapter._http_client
+
     def include_warehouse(self, warehouse) -> bool:
         return True
 
+    def prepare_warehouse(self, warehouse: dict[str, str], configured_tables: list):
+        """Called before a data source's configured tables are synced, e.g. to bulk-load existing catalog state"""
+        pass
+
+    def close(self, completed: bool = True):
+        """Called once at the end of a run; `completed` is False if the run stopped with an error"""
+        pass
+
     def update_catalog_asset(
         self, warehouse: dict[str, str], table_summary: AnomaloTableSummary
     ) -> bool:
+        """Publish DQ status for one table; returns None if the update was queued for `flush_catalog_updates()`"""
         raise NotImplementedError(
             f"{self.__class__.__name__} adapter is incomplete; it needs to override method `update_catalog_asset()`"
         )
+
+    def update_catalog_checks(
+        self, warehouse: dict[str, str], table_summary: AnomaloTableSummary, check_records
+    ) -> bool:
+        """Publish the status of each of a table's checks (`--sync-checks`), after its table-level status.
+
+        `check_records` is an iterable of AnomaloCheckRecord; returns None if the update was queued
+        for `flush_catalog_updates()`. Adapters that don't override this don't support per-check sync.
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} adapter does not support per-check sync"
+        )
+
+    def update_catalog_columns(
+        self, warehouse: dict[str, str], table_summary: AnomaloTableSummary, column_statuses
+    ) -> bool:
+        """Publish the DQ status of a table's checked columns (`--sync-columns`), after its table-level status.
+
+        `column_statuses` maps column names to AnomaloColumnStatus; returns None if the update was
+        queued for `flush_catalog_updates()`. Adapters that don't override this don't support column sync.
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} adapter does not support column sync"
+        )
+
+    @classmethod
+    def supports_check_sync(cls) -> bool:
+        return cls.update_catalog_checks is not AnomaloCatalogAdapter.update_catalog_checks
+
+    @classmethod
+    def supports_column_sync(cls) -> bool:
+        return (
+            cls.update_catalog_columns
+            is not AnomaloCatalogAdapter.update_catalog_columns
+        )
+
+    @staticmethod
+    def _chunks(items, size: int):
+        """Yield lists of up to `size` items, reading `items` lazily"""
+        items = iter(items)
+        while chunk := list(islice(items, size)):
+            yield chunk
+
+    def flush_catalog_updates(self, warehouse: dict[str, str]) -> dict[str, bool]:
+        """Apply any updates queued by `update_catalog_asset()`; returns whether each queued table was updated, by Anomalo table id"""
+        with self._batch_lock:
+            batch, self._pending_updates = self._pending_updates, []
+        if batch:
+            self._run_batch(batch)
+        with self._batch_lock:
+            results, self._batch_results = self._batch_results, {}
+        return results
+
+    def _queue_update(self, table_id, update):
+        """Queue an update for `_apply_batch()`; the batch is applied once `batch_size` updates are queued"""
+        with self._batch_lock:
+            self._pending_updates.append((table_id, update))
+            if len(self._pending_updates) < self.batch_size:
+                return
+            batch, self._pending_updates = self._pending_updates, []
+        self._run_batch(batch)
+
+    def _run_batch(self, batch: list[tuple]):
+        try:
+            results = self._apply_batch(batch)
+        except Exception as e:
+            print(traceback.format_exc())
+            results = {table_id: False for table_id, _ in batch}
+        with self._batch_lock:
+            # a table's updates may be queued in several parts; it was updated only if all of them were
+            for table_id, updated in results.items():
+                self._batch_results[table_id] = (
+                    self._batch_results.get(table_id, True) and updated
+                )
+
+    def _apply_batch(self, batch: list[tuple]) -> dict:
+        """Apply a batch of `(table_id, update)` pairs queued by `_queue_update()`; returns whether each table was updated"""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} adapter does not support batched updates"
+        )
@@ -1,5 +1,483 @@
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from anomalo_api import AnomaloTableSummary
+
 from adapters.base_adapter import AnomaloCatalogAdapter
 
 
+# index value for a key that matches more than one Collibra asset
+AMBIGUOUS_ASSET = object()
+
+COLLIBRA_PAGE_SIZE = 1000
+# tables per import job if --batch-size is not given
+COLLIBRA_DEFAULT_BATCH_SIZE = 500
+COLLIBRA_JOB_TIMEOUT = 1800
+# check assets per queued update with --sync-checks; each counts as one table towards the batch size
+COLLIBRA_CHECKS_PER_UPDATE = 100
+COLLIBRA_JOB_FINISHED_STATES = ("COMPLETED", "ERROR", "CANCELED")
+
+TABLE_ASSET_TYPE_PUBLIC_ID = "Table"
+CHECK_ASSET_TYPE_PARENT_PUBLIC_ID = "DataQualityRule"
+
+SUMMARY_ATTRIBUTE = "Anomalo Data Quality Summary"
+CHECK_ASSET_TYPE = "Anomalo Data Quality Check"
+CHECK_RELATION_ROLE = "has Anomalo Data Quality Check"
+CHECK_RELATION_CO_ROLE = "is Anomalo Data Quality Check of"
+# attribute name -> (kind, string type) of the attributes of Anomalo check assets
+CHECK_ATTRIBUTES = {
+    "Category": ("STRING", "PLAIN_TEXT"),
+    "Check Status": ("STRING", "PLAIN_TEXT"),
+    "Check Result": ("STRING", "RICH_TEXT"),
+    "Check Run URL": ("STRING", "PLAIN_TEXT"),
+    "Anomalo Sync Time": ("STRING", "PLAIN_TEXT"),
+}
+
+
 class collibra(AnomaloCatalogAdapter):
-    pass
+    def configure(self):
+        super().configure()
+        hostname = self._get_or_throw("COLLIBRA_HOSTNAME")
+        parsed = urlparse(hostname)
+        if not parsed.scheme or not parsed.netloc:
+            self.collibra_rooturl = "https://" + hostname.rstrip("/")
+        else:
+            self.collibra_rooturl = f"{parsed.scheme}://{parsed.netloc}"
+        self.api_url = f"{self.collibra_rooturl}/rest/2.0"
+        self._auth = (
+            self._get_or_throw("COLLIBRA_USER"),
+            self._get_or_throw("COLLIBRA_PASSWORD"),
+        )
+
+        # Updates are always submitted as bulk import jobs
+        self.batch_size = self._args.batch_size or COLLIBRA_DEFAULT_BATCH_SIZE
+
+        # Table assets by name, see `_resolve_table_asset()`
+        self._asset_index = None
+        self._asset_index_lock = threading.Lock()
+        self._resolved_assets = {}
+        self._domain_communities = {}
+
+        self._register_operating_model()
+
+    def _get(self, path: str, **params) -> dict:
+        response = self.http.get(
+            f"{self.api_url}{path}", params=params, auth=self._auth
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def _post(self, path: str, body: dict) -> dict:
+        response = self.http.post(f"{self.api_url}{path}", json=body, auth=self._auth)
+        response.raise_for_status()
+        return response.json()
+
+    def _get_paged(self, path: str, **params):
+        """Yield every result of a paginated Collibra list endpoint"""
+        offset = 0
+        while True:
+            page = self._get(path, offset=offset, limit=COLLIBRA_PAGE_SIZE, **params)
+            results = page.get("results", [])
+            yield from results
+            offset += len(results)
+            if not results or offset >= page.get("total", 0):
+                return
+
+    def _patch(self, path: str, body: dict) -> dict:
+        response = self.http.request(
+            "PATCH", f"{self.api_url}{path}", json=body, auth=self._auth
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def _find_one(self, path: str, **params) -> dict:
+        results = self._get(path, **params).get("results", [])
+        return results[0] if results else None
+
+    def _register_operating_model(self):
+        """Find or create the attribute, asset and relation types the integration writes to, and assign them to the asset types"""
+        summary_attribute = self._get_or_create_attribute_type(
+            SUMMARY_ATTRIBUTE, "STRING", "RICH_TEXT"
+        )
+        check_attributes = [
+            self._get_or_create_attribute_type(name, kind, string_type)
+            for name, (kind, string_type) in CHECK_ATTRIBUTES.items()
+        ]
+
+        table_type = self._get(f"/assetTypes/publicId/{TABLE_ASSET_TYPE_PUBLIC_ID}")
+        check_type = self._find_one(
+            "/assetTypes", name=CHECK_ASSET_TYPE, nameMatchMode="EXACT"
+        )
+        if not check_type:
+            parent = self._get(
+                f"/assetTypes/publicId/{CHECK_ASSET_TYPE_PARENT_PUBLIC_ID}"
+            )
+            check_type = self._post(
+                "/assetTypes",
+                {
+                    "name": CHECK_ASSET_TYPE,
+                    "description": "A data quality check monitored by Anomalo",
+                    "parentId": parent["id"],
+                },
+            )
+            print(f"Created Collibra asset type `{CHECK_ASSET_TYPE}`")
+
+        relation_type = self._find_one(
+            "/relationTypes",
+            sourceTypeId=table_type["id"],
+            targetTypeId=check_type["id"],
+            role=CHECK_RELATION_ROLE,
+        )
+        if not relation_type:
+            relation_type = self._post(
+                "/relationTypes",
+                {
+                    "sourceTypeId": table_type["id"],
+                    "targetTypeId": check_type["id"],
+                    "role": CHECK_RELATION_ROLE,
+                    "coRole": CHECK_RELATION_CO_ROLE,
+                },
+            )
+            print(f"Created Collibra relation type `{CHECK_RELATION_ROLE}`")
+        self._check_relation_type_id = relation_type["id"]
+        self._check_asset_type_id = check_type["id"]
+
+        # imports can only set the characteristics assigned to an asset's type
+        self._assign_characteristics(
+            table_type,
+            [(summary_attribute, "AttributeType"), (relation_type, "RelationType")],
+        )
+        self._assign_characteristics(
+            check_type, [(a, "AttributeType") for a in check_attributes]
+        )
+
+    def _get_or_create_attribute_type(
+        self, name: str, kind: str, string_type: str
+    ) -> dict:
+        attribute_type = self._find_one(
+            "/attributeTypes", name=name, nameMatchMode="EXACT"
+        )
+        if attribute_type:
+            return attribute_type
+        attribute_type = self._post(
+            "/attributeTypes",
+            {
+                "name": name,
+                "kind": kind,
+                "stringType": string_type,
+                "description": f"{name} (Anomalo)",
+            },
+        )
+        print(f"Created Collibra attribute type `{name}`")
+        return attribute_type
+
+    def _assign_characteristics(self, asset_type: dict, characteristics: list[tuple]):
+        """Add `(attribute or relation type, kind)` characteristics missing from an asset type's global assignment"""
+        assignments = [
+            a
+            for a in self._get(f"/assignments/assetType/{asset_type['id']}")
+            if not a.get("scope")
+        ]
+        if not assignments:
+            raise RuntimeError(
+                f"Collibra asset type `{asset_type['name']}` has no global assignment"
+            )
+        # a new asset type uses its parent's assignment until it has its own
+        own = next(
+            (a for a in assignments if a["assetType"]["id"] == asset_type["id"]), None
+        )
+        assignment = own or assignments[0]
+        assigned = {c["id"] for c in assignment.get("characteristicTypes", [])}
+        missing = [
+            {"id": c["id"], "type": kind}
+            for c, kind in characteristics
+            if c["id"] not in assigned
+        ]
+        if not missing:
+            return
+        characteristic_types = assignment.get("characteristicTypes", []) + missing
+        if own:
+            self._patch(
+                f"/assignments/{own['id']}",
+                {"characteristicTypes": characteristic_types},
+            )
+        else:
+            self._post(
+                "/assignments",
+                {
+                    "assetTypeId": asset_type["id"],
+                    "statusIds": [s["id"] for s in assignment.get("statuses", [])],
+                    "characteristicTypes": characteristic_types,
+                },
+            )
+        print(
+            f"Assigned {len(missing)} Anomalo characteristics to Collibra asset type `{asset_type['name']}`"
+        )
+
+    @staticmethod
+    def _index_keys(name: str) -> list[str]:
+        """Lookup keys for a Collibra table name: the full name and its last two and last one parts"""
+        parts = name.lower().replace(">", ".").replace("/", ".").split(".")
+        return list(dict.fromkeys([".".join(parts), ".".join(parts[-2:]), parts[-1]]))
+
+    def _build_asset_index(self) -> dict:
+        """Index every Table asset by name, with one paginated read of the assets and the domains"""
+        print("Reading Collibra table assets...")
+        communities = {
+            domain["id"]: domain.get("community", {}).get("name")
+            for domain in self._get_paged("/domains")
+        }
+        index = {}
+        for asset in self._get_paged(
+            "/assets", typePublicIds=TABLE_ASSET_TYPE_PUBLIC_ID
+        ):
+            asset["community"] = communities.get(asset["domain"]["id"])
+            for key in self._index_keys(asset["name"]):
+                index[key] = AMBIGUOUS_ASSET if key in index else asset
+        print(f"Indexed {len(index)} names of Collibra table assets")
+        return index
+
+    def _lookup_table_asset(self, table_name: str) -> list[dict]:
+        """Find Table assets named like a table, one table at a time (`--no-prefetch`)"""
+        assets = self._get(
+            "/assets",
+            name=table_name,
+            nameMatchMode="END",
+            typePublicIds=TABLE_ASSET_TYPE_PUBLIC_ID,
+        ).get("results", [])
+        for asset in assets:
+            asset["community"] = self._get_domain_community(asset["domain"]["id"])
+        return assets
+
+    def _get_asset(self, asset_id: str) -> dict:
+        """Asset by id, e.g. recorded by a previous run (`--no-prefetch`); None if it no longer exists"""
+        response = self.http.get(f"{self.api_url}/assets/{asset_id}", auth=self._auth)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        asset = response.json()
+        asset["community"] = self._get_domain_community(asset["domain"]["id"])
+        return asset
+
+    def _get_domain_community(self, domain_id: str) -> str:
+        if domain_id not in self._domain_communities:
+            domain = self._get(f"/domains/{domain_id}")
+            self._domain_communities[domain_id] = domain.get("community", {}).get(
+                "name"
+            )
+        return self._domain_communities[domain_id]
+
+    def _resolve_table_asset(self, table_full_name: str, asset_id: str = None) -> dict:
+        """Collibra Table asset of an Anomalo table, or None; results are cached for the run.
+
+        Without an asset index, the asset id recorded by a previous run is read first, if given.
+        """
+        key = table_full_name.lower()
+        with self._asset_index_lock:
+            if key in self._resolved_assets:
+                return self._resolved_assets[key]
+            if self._args.prefetch_catalog_state and self._asset_index is None:
+                self._asset_index = self._build_asset_index()
+            index = self._asset_index
+
+        asset = None
+        if index is not None:
+            for candidate in self._index_keys(table_full_name):
+                asset = index.get(candidate)
+                if asset is not None:
+                    break
+        else:
+            if asset_id:
+                asset = self._get_asset(asset_id)
+            if asset is None:
+                # one lookup per table, outside the lock so workers resolve tables concurrently
+                table_keys = set(self._index_keys(table_full_name))
+                matches = [
+                    a
+                    for a in self._lookup_table_asset(table_full_name.split(".")[-1])
+                    if table_keys & set(self._index_keys(a["name"]))
+                ]
+                if len(matches) > 1:
+                    asset = AMBIGUOUS_ASSET
+                elif matches:
+                    asset = matches[0]
+
+        if asset is AMBIGUOUS_ASSET:
+            print(
+                f"WARNING More than one Collibra table asset matches `{table_full_name}`, will not update it"
+            )
+            asset = None
+        with self._asset_index_lock:
+            self._resolved_assets[key] = asset
+        return asset
+
+    @staticmethod
+    def _asset_identifier(asset: dict) -> dict:
+        return {
+            "name": asset["name"],
+            "domain": {
+                "name": asset["domain"]["name"],
+                "community": {"name": asset["community"]},
+            },
+        }
+
+    def update_catalog_asset(
+        self, warehouse: dict[str, str], table_summary: AnomaloTableSummary
+    ) -> bool:
+        asset = self._resolve_table_asset(
+            table_summary.table_full_name, table_summary.catalog_asset_id
+        )
+        if not asset:
+            print(
+                f"WARNING Cannot find Collibra table asset for {table_summary.table_full_name}, will not update Collibra"
+            )
+            return False
+        print(
+            f"Matched {table_summary.table_full_name} to Collibra asset {asset['name']} ({asset['id']})"
+        )
+        table_summary.catalog_asset_id = asset["id"]
+
+        row = {
+            "resourceType": "Asset",
+            "identifier": self._asset_identifier(asset),
+            "type": {"name": asset["type"]["name"]},
+            "attributes": {
+                SUMMARY_ATTRIBUTE: [{"value": table_summary.get_status_text("html")}]
+            },
+        }
+        self._queue_update(table_summary.table_id, [row])
+        return None
+
+    def update_catalog_checks(
+        self, warehouse: dict[str, str], table_summary: AnomaloTableSummary, check_records
+    ) -> bool:
+        asset = self._resolve_table_asset(table_summary.table_full_name)
+        if not asset:
+            return False
+        table_identifier = self._asset_identifier(asset)
+        sync_time = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+        check_asset_names = set()
+        for records in self._chunks(check_records, COLLIBRA_CHECKS_PER_UPDATE):
+            rows = [
+                {
+                    "resourceType": "Asset",
+                    # check names need not be unique, so the asset name includes the Anomalo check id
+                    "identifier": {
+                        "name": self._check_asset_name(asset, record.check_id),
+                        "domain": table_identifier["domain"],
+                    },
+                    "displayName": record.name,
+                    "type": {"name": CHECK_ASSET_TYPE},
+                    "attributes": {
+                        "Category": [{"value": record.category}],
+                        "Check Status": [{"value": record.status}],
+                        "Check Result": [{"value": record.result}],
+                        "Check Run URL": [{"value": record.run_url}],
+                        "Anomalo Sync Time": [{"value": sync_time}],
+                    },
+                    # the table is the source of its "has Anomalo Data Quality Check" relations
+                    "relations": {
+                        f"{self._check_relation_type_id}:SOURCE": [table_identifier]
+                    },
+                }
+                for record in records
+            ]
+            check_asset_names.update(row["identifier"]["name"] for row in rows)
+            self._queue_update(table_summary.table_id, rows)
+        print(
+            f"Queued {len(check_asset_names)} Anomalo check assets of {table_summary.table_full_name}"
+        )
+        if not self._delete_stale_check_assets(asset, check_asset_names):
+            return False
+        return None
+
+    @staticmethod
+    def _check_asset_name(asset: dict, check_id) -> str:
+        return f"{asset['name']} > Anomalo check {check_id}"
+
+    def _delete_stale_check_assets(self, asset: dict, check_asset_names: set) -> bool:
+        """Delete the table's check assets of checks that no longer exist in Anomalo, with their relations"""
+        stale_ids = [
+            a["id"]
+            for a in self._get_paged(
+                "/assets",
+                name=self._check_asset_name(asset, ""),
+                nameMatchMode="START",
+                domainId=asset["domain"]["id"],
+                typeIds=self._check_asset_type_id,
+            )
+            if a["name"] not in check_asset_names
+        ]
+        if not stale_ids:
+            return True
+        # deleting an asset also deletes its relations
+        response = self.http.delete(
+            f"{self.api_url}/assets/bulk", json=stale_ids, auth=self._auth
+        )
+        if not response.ok:
+            print(
+                f"ERROR deleting {len(stale_ids)} stale Anomalo check assets of {asset['name']}: {response.status_code} {response.text}"
+            )
+            return False
+        print(f"Deleted {len(stale_ids)} stale Anomalo check assets of {asset['name']}")
+        return True
+
+    def _apply_batch(self, batch: list[tuple[int, list[dict]]]) -> dict:
+        """Import a batch of tables' rows in one job; a failed batch is split in half and retried to find the failing tables"""
+        rows = [row for _, table_rows in batch for row in table_rows]
+        if self._run_import_job(rows):
+            return {table_id: True for table_id, _ in batch}
+        if len(batch) == 1:
+            return {batch[0][0]: False}
+        middle = len(batch) // 2
+        print("Retrying the tables of a failed Collibra import job in two halves")
+        results = self._apply_batch(batch[:middle])
+        # a table's table and check rows may be in both halves
+        for table_id, updated in self._apply_batch(batch[middle:]).items():
+            results[table_id] = results.get(table_id, True) and updated
+        return results
+
+    def _run_import_job(self, rows: list[dict]) -> bool:
+        """Submit rows to the bulk import API and wait for the job to finish; returns whether it succeeded"""
+        response = self.http.post(
+            f"{self.api_url}/import/json-job",
+            auth=self._auth,
+            files={
+                "file": ("anomalo-import.json", json.dumps(rows), "application/json")
+            },
+            data={"sendNotification": "false", "continueOnError": "false"},
+        )
+        if not response.ok:
+            print(
+                f"ERROR Collibra import of {len(rows)} assets failed: {response.status_code} {response.text}"
+            )
+            return False
+        job_id = response.json()["id"]
+        print(f"Submitted Collibra import job {job_id} for {len(rows)} assets")
+
+        delay = 0.5
+        deadline = time.monotonic() + COLLIBRA_JOB_TIMEOUT
+        while True:
+            job = self._get(f"/jobs/{job_id}")
+            if job.get("state") in COLLIBRA_JOB_FINISHED_STATES:
+                break
+            if time.monotonic() > deadline:
+                print(f"ERROR Collibra import job {job_id} did not finish in time")
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 10)
+
+        if (
+            job.get("state") == "COMPLETED"
+            and job.get("result", "SUCCESS") == "SUCCESS"
+        ):
+            print(f"Collibra import job {job_id} completed")
+            return True
+        print(
+            f"ERROR Collibra import job {job_id} {job.get('state')}: {job.get('message') or job.get('result')}"
+        )
+        return False
@@ -1,10 +1,194 @@
 import os
 import time
 
-import requests
 from anomalo_api import AnomaloTableSummary
 
 from adapters.base_adapter import AnomaloCatalogAdapter
+from adapters.http_client import HttpClient
+
+
+# https://docs.databricks.com/api/workspace/statementexecution
+STATEMENT_RUNNING_STATES = ("PENDING", "RUNNING")
+
+# Column tags set by `--sync-columns`
+COLUMN_STATUS_TAG = "ANOMALO_DQ_STATUS"
+COLUMN_CHECKS_TAG = "ANOMALO_DQ_CHECKS"
+# column statements per queued update with --batch-size; each counts as one table towards the batch size
+COLUMN_STATEMENTS_PER_UPDATE = 100
+
+
+class DatabricksStatementError(Exception):
+    pass
+
+
+class StatementExecutor:
+    """Runs SQL statements on a Databricks SQL warehouse and tracks them until they reach a terminal state.
+
+    Statements that finish within `wait_timeout` are returned from the submit call without polling.
+    Unfinished statements are polled together, backing off from `poll_interval` up to
+    `max_poll_interval` seconds while none of them change state.
+    """
+
+    def __init__(
+        self,
+        warehouse_id: str,
+        rooturl: str = None,
+        api_token: str = None,
+        workspace_client=None,
+        http=None,
+        wait_timeout: str = "10s",
+        poll_interval: float = 0.25,
+        max_poll_interval: float = 5.0,
+        timeout: float = 600,
+    ):
+        self._warehouse_id = warehouse_id
+        self._rooturl = rooturl
+        self._workspace_client = workspace_client
+        self._http = http or HttpClient()
+        self._headers = {
+            "Accept": "application/json",
+            "Authorization": f"Bearer {api_token}",
+        }
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+
+    @staticmethod
+    def state(statement: dict) -> str:
+        return statement.get("status", {}).get("state")
+
+    def submit(self, sql: str, wait_timeout: str = "0s") -> dict:
+        """Submit a statement; waits up to `wait_timeout` for it to finish and returns its latest status"""
+        if self._workspace_client:
+            return self._workspace_client.statement_execution.execute_statement(
+                statement=sql,
+                warehouse_id=self._warehouse_id,
+                wait_timeout=wait_timeout,
+            ).as_dict()
+
+        response = self._http.post(
+            self._rooturl + "/api/2.0/sql/statements/",
+            json={
+                "statement": sql,
+                "wait_timeout": wait_timeout,
+                "warehouse_id": self._warehouse_id,
+            },
+            headers=self._headers,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def get(self, statement_id: str) -> dict:
+        if self._workspace_client:
+            return self._workspace_client.statement_execution.get_statement(
+                statement_id
+            ).as_dict()
+
+        response = self._http.get(
+            self._rooturl + "/api/2.0/sql/statements/" + statement_id,
+            headers=self._headers,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def cancel(self, statement_id: str):
+        if self._workspace_client:
+            self._workspace_client.statement_execution.cancel_execution(statement_id)
+            return
+
+        response = self._http.post(
+            self._rooturl + f"/api/2.0/sql/statements/{statement_id}/cancel",
+            headers=self._headers,
+        )
+        response.raise_for_status()
+
+    def wait(self, statements: list[dict]) -> list[dict]:
+        """Poll until every statement has finished; returns the final status of each, in order.
+
+        Statements still running after `timeout` seconds are cancelled and reported as CANCELED.
+        """
+        statements = list(statements)
+        pending = [
+            i
+            for i, s in enumerate(statements)
+            if self.state(s) in STATEMENT_RUNNING_STATES
+        ]
+        deadline = time.monotonic() + self.timeout
+        interval = self.poll_interval
+        while pending:
+            if time.monotonic() >= deadline:
+                for i in pending:
+                    statement_id = statements[i]["statement_id"]
+                    try:
+                        self.cancel(statement_id)
+                    except Exception as e:
+                        print(f"    WARNING: Could not cancel statement {statement_id}: {e}")
+                    statements[i] = {
+                        "statement_id": statement_id,
+                        "status": {
+                            "state": "CANCELED",
+                            "error": {"message": f"timed out after {self.timeout}s"},
+                        },
+                    }
+                break
+
+            time.sleep(interval)
+            still_pending = []
+            for i in pending:
+                statements[i] = self.get(statements[i]["statement_id"])
+                if self.state(statements[i]) in STATEMENT_RUNNING_STATES:
+                    still_pending.append(i)
+            if len(still_pending) == len(pending):
+                # nothing finished this round, back off
+                interval = min(interval * 2, self.max_poll_interval)
+            pending = still_pending
+        return statements
+
+    def execute(self, sql: str) -> dict:
+        """Run a statement to completion and return its result; raises DatabricksStatementError if it did not succeed"""
+        statement = self.submit(sql, wait_timeout=self.wait_timeout)
+        if self.state(statement) in STATEMENT_RUNNING_STATES:
+            statement = self.wait([statement])[0]
+        return self.raise_for_state(statement, sql)
+
+    def execute_many(self, sqls: list[str]) -> list[dict]:
+        """Submit all statements without waiting, then track them together until they finish.
+
+        Returns the final status of each statement in order; failed statements are not raised.
+        """
+        return self.wait([self.submit(sql) for sql in sqls])
+
+    def fetch_rows(self, sql: str):
+        """Run a query and yield its result rows, following result chunks as needed"""
+        statement = self.execute(sql)
+        chunk = statement.get("result") or {}
+        while True:
+            yield from chunk.get("data_array") or []
+            if self._workspace_client:
+                chunk_index = chunk.get("next_chunk_index")
+                if chunk_index is None:
+                    return
+                chunk = self._workspace_client.statement_execution.get_statement_result_chunk_n(
+                    statement["statement_id"], chunk_index
+                ).as_dict()
+            else:
+                chunk_link = chunk.get("next_chunk_internal_link")
+                if not chunk_link:
+                    return
+                response = self._http.get(self._rooturl + chunk_link, headers=self._headers)
+                response.raise_for_status()
+                chunk = response.json()
+
+    def raise_for_state(self, statement: dict, sql: str = None) -> dict:
+        state = self.state(statement)
+        if state != "SUCCEEDED":
+            error = statement.get("status", {}).get("error", {}).get("message", "")
+            raise DatabricksStatementError(
+                f"Statement {statement.get('statement_id')} {state}: {error}"
+                + (f"\n    SQL: {sql[:200]}" if sql else "")
+            )
+        return statement
 
 
 class databricks(AnomaloCatalogAdapter):
@@ -31,6 +215,21 @@ class databricks(AnomaloCatalogAdapter):
                 f"Unknown DATABRICKS_AUTH_METHOD '{auth_method}'. Supported: 'token', 'sdk'"
             )
 
+        self._statements = StatementExecutor(
+            self._dbx_warehouse_id,
+            rooturl=self._dbx_rooturl,
+            api_token=self._dbx_api_token,
+            workspace_client=self._workspace_client,
+            http=self.http,
+        )
+
+        # existing comment and tags by lower-case table FQN, for prefetched catalogs
+        self._table_comments = {}
+        self._table_tags = {}
+        self._prefetched_catalogs = set()
+        # existing columns and their tags by lower-case table FQN and column name, for `--sync-columns`
+        self._table_columns = {}
+
     def _get_metastore_name(self, warehouse) -> str:
         if warehouse["warehouse_type"] != "databricks":
             return None
@@ -49,40 +248,249 @@ class databricks(AnomaloCatalogAdapter):
     def include_warehouse(self, warehouse) -> bool:
         return self._get_metastore_name(warehouse) != None
 
+    def prepare_warehouse(self, warehouse, configured_tables):
+        if not self._args.prefetch_catalog_state:
+            return
+        metastore_name = self._get_metastore_name(warehouse)
+        schemas = sorted(
+            {t["table"]["full_name"].split(".")[0] for t in configured_tables}
+        )
+        if not schemas:
+            return
+
+        print(f"  Prefetching comments and tags for catalog `{metastore_name}`...")
+        catalog_filter = self._sql_string(metastore_name)
+        schema_filter = ", ".join(self._sql_string(s) for s in schemas)
+        try:
+            table_count = 0
+            for schema, table, comment in self._statements.fetch_rows(
+                "SELECT table_schema, table_name, comment FROM system.information_schema.tables"
+                f" WHERE table_catalog = {catalog_filter} AND table_schema IN ({schema_filter})"
+            ):
+                self._table_comments[f"{metastore_name}.{schema}.{table}".lower()] = (
+                    comment or ""
+                )
+                table_count += 1
+
+            tag_count = 0
+            for schema, table, tag_name, tag_value in self._statements.fetch_rows(
+                "SELECT schema_name, table_name, tag_name, tag_value FROM system.information_schema.table_tags"
+                f" WHERE catalog_name = {catalog_filter} AND schema_name IN ({schema_filter})"
+            ):
+                fqtable = f"{metastore_name}.{schema}.{table}".lower()
+                self._table_tags.setdefault(fqtable, {})[tag_name] = tag_value
+                tag_count += 1
+
+            column_count = 0
+            if getattr(self._args, "sync_columns", False):
+                for schema, table, column in self._statements.fetch_rows(
+                    "SELECT table_schema, table_name, column_name FROM system.information_schema.columns"
+                    f" WHERE table_catalog = {catalog_filter} AND table_schema IN ({schema_filter})"
+                ):
+                    fqtable = f"{metastore_name}.{schema}.{table}".lower()
+                    self._table_columns.setdefault(fqtable, {})[column.lower()] = {
+                        "name": column,
+                        "tags": {},
+                    }
+                    column_count += 1
+                for schema, table, column, tag_name, tag_value in self._statements.fetch_rows(
+                    "SELECT schema_name, table_name, column_name, tag_name, tag_value FROM system.information_schema.column_tags"
+                    f" WHERE catalog_name = {catalog_filter} AND schema_name IN ({schema_filter})"
+                ):
+                    fqtable = f"{metastore_name}.{schema}.{table}".lower()
+                    existing = self._table_columns.get(fqtable, {}).get(column.lower())
+                    if existing:
+                        existing["tags"][tag_name] = tag_value
+        except Exception as e:
+            print(
+                f"    WARNING: Could not prefetch catalog state, reading comments per table instead: {e}"
+            )
+            return
+
+        self._prefetched_catalogs.add(metastore_name.lower())
+        print(f"  Prefetched {table_count} table comments and {tag_count} tags")
+        if column_count:
+            print(f"  Prefetched {column_count} columns and their tags")
+
     def update_catalog_asset(
         self, warehouse: dict[str, str], table_summary: AnomaloTableSummary
     ) -> bool:
         metastore_name = self._get_metastore_name(warehouse)
 
         dbx_fqn = metastore_name + "." + table_summary.table_full_name
+        table_summary.catalog_asset_id = dbx_fqn
         print(f"  Updating asset: {dbx_fqn}")
 
         markdown = table_summary.get_status_text(dialect="markdown").strip()
-        self._comment(dbx_fqn, markdown)
-
         tags_to_apply = table_summary.get_tags_to_apply()
         tags_to_remove = table_summary.get_tags_to_remove()
-        self._set_tags(dbx_fqn, tags_to_apply)
-        self._delete_tags(dbx_fqn, tags_to_remove)
+        statements = [
+            sql
+            for sql in (
+                self._comment_statement(dbx_fqn, markdown),
+                self._set_tags_statement(dbx_fqn, tags_to_apply),
+                self._delete_tags_statement(dbx_fqn, tags_to_remove),
+            )
+            if sql
+        ]
+
+        if not statements:
+            print(f"    Comment and tags are already up to date")
+            return True
+
+        if self._args.batch_size > 0:
+            self._queue_update(table_summary.table_id, (dbx_fqn, statements))
+            return None
+
+        # submitted together and tracked until they all finish
+        updated = True
+        for sql, statement in zip(statements, self._statements.execute_many(statements)):
+            try:
+                self._statements.raise_for_state(statement, sql)
+            except DatabricksStatementError as e:
+                print(f"    ERROR updating {dbx_fqn}: {e}")
+                updated = False
+        return updated
+
+    def update_catalog_columns(
+        self, warehouse: dict[str, str], table_summary: AnomaloTableSummary, column_statuses
+    ) -> bool:
+        """Tag each checked column with its DQ status, with one statement per column that changed"""
+        fqtable = table_summary.catalog_asset_id
+        try:
+            columns = self._get_table_columns(fqtable)
+        except Exception as e:
+            print(f"    ERROR: Could not read the columns of {fqtable}: {e}")
+            return False
+
+        statements = []
+        missing = []
+        for column_name, column_status in column_statuses.items():
+            column = columns.get(column_name.lower())
+            if column is None:
+                missing.append(column_name)
+                continue
+            sql = self._column_tags_statement(fqtable, column, column_status)
+            if sql:
+                statements.append(sql)
+        if missing:
+            print(f"    WARNING: Columns not found in {fqtable}: {', '.join(missing)}")
+        if not statements:
+            print(f"    Column tags are already up to date")
+            return True
+        print(f"    Tagging {len(statements)} columns")
+
+        if self._args.batch_size > 0:
+            for sqls in self._chunks(statements, COLUMN_STATEMENTS_PER_UPDATE):
+                self._queue_update(table_summary.table_id, (fqtable, sqls))
+            return None
+
+        # submitted together and tracked until they all finish
+        updated = True
+        for statement in self._statements.execute_many(statements):
+            try:
+                self._statements.raise_for_state(statement)
+            except DatabricksStatementError as e:
+                print(f"    ERROR updating column tags of {fqtable}: {e}")
+                updated = False
+        return updated
+
+    def _get_table_columns(self, fqtable: str) -> dict:
+        """Columns of a table and their existing tags by lower-case column name; tags are only known if prefetched"""
+        if self._is_prefetched(fqtable) and fqtable.lower() in self._table_columns:
+            return self._table_columns[fqtable.lower()]
+        if self._workspace_client:
+            names = [c.name for c in self._workspace_client.tables.get(fqtable).columns or []]
+        else:
+            response = self.http.get(
+                self._dbx_rooturl + "/api/2.1/unity-catalog/tables/" + fqtable,
+                headers={"Authorization": "Bearer " + self._dbx_api_token},
+            )
+            response.raise_for_status()
+            names = [c["name"] for c in response.json().get("columns") or []]
+        return {name.lower(): {"name": name, "tags": {}} for name in names}
+
+    def _column_tags_statement(self, fqtable: str, column: dict, column_status) -> str:
+        tags = {
+            COLUMN_STATUS_TAG: column_status.status,
+            COLUMN_CHECKS_TAG: f"{column_status.passed}/{column_status.total} passed",
+        }
+        if all(column["tags"].get(k) == v for k, v in tags.items()):
+            return None
+        formatted_tags = ", ".join([f"'{k}' = '{v}'" for k, v in tags.items()])
+        quoted_column = "`" + column["name"].replace("`", "``") + "`"
+        return f"ALTER TABLE {fqtable} ALTER COLUMN {quoted_column} SET TAGS ({formatted_tags})"
+
+    def _apply_batch(self, batch: list[tuple[int, tuple[str, list[str]]]]) -> dict:
+        """Run a batch of queued table statements as one SQL script.
+
+        If the script fails, each table's statements are resubmitted as a separate script
+        so that success and failure is reported for each table.
+        """
+        print(f"  Submitting Databricks SQL batch for {len(batch)} tables...")
+        statement = self._statements.submit(
+            self._script([sql for _, (_, sqls) in batch for sql in sqls]),
+            wait_timeout=self._statements.wait_timeout,
+        )
+        statement = self._statements.wait([statement])[0]
+        if self._statements.state(statement) == "SUCCEEDED":
+            return {table_id: True for table_id, _ in batch}
 
-        return True
+        error = statement.get("status", {}).get("error", {}).get("message", "")
+        print(
+            f"    WARNING: batch of {len(batch)} tables failed, retrying tables individually: {error}"
+        )
+        results = {}
+        table_statements = self._statements.execute_many(
+            [self._script(sqls) for _, (_, sqls) in batch]
+        )
+        for (table_id, (fqtable, _)), statement in zip(batch, table_statements):
+            try:
+                self._statements.raise_for_state(statement)
+                # a table's table and column statements may be queued separately
+                results.setdefault(table_id, True)
+            except DatabricksStatementError as e:
+                print(f"    ERROR updating {fqtable}: {e}")
+                results[table_id] = False
+        return results
+
+    @staticmethod
+    def _script(statements: list[str]) -> str:
+        """Combine statements into a single SQL scripting compound statement"""
+        if len(statements) == 1:
+            return statements[0]
+        body = "\n".join(f"  {sql};" for sql in statements)
+        return f"BEGIN\n{body}\nEND"
+
+    @staticmethod
+    def _sql_string(value: str) -> str:
+        return "'" + value.replace("'", "''") + "'"
+
+    def _is_prefetched(self, fqtable: str) -> bool:
+        """Whether the table's comment and tags were prefetched; tables created since then are read per table"""
+        return (
+            fqtable.split(".", 1)[0].lower() in self._prefetched_catalogs
+            and fqtable.lower() in self._table_comments
+        )
 
     def _get_existing_comment(self, fqtable: str) -> str:
+        if self._is_prefetched(fqtable):
+            return self._table_comments.get(fqtable.lower(), "")
         if self._workspace_client:
             return self._workspace_client.tables.get(fqtable).comment or ""
         else:
-            response = requests.get(
+            response = self.http.get(
                 self._dbx_rooturl + "/api/2.1/unity-catalog/tables/" + fqtable,
                 headers={"Authorization": "Bearer " + self._dbx_api_token},
             )
             response.raise_for_status()
             return response.json().get("comment", "") or ""
 
-    def _comment(self, fqtable: str, markdown: str):
+    def _comment_statement(self, fqtable: str, markdown: str) -> str:
         if self._args.overwrite_table_comment:
-            sql = f"COMMENT ON TABLE {fqtable} IS '" + markdown.replace("'", "''") + "'"
-            self._run_sql(sql)
-            return
+            if self._is_prefetched(fqtable) and markdown == self._get_existing_comment(fqtable):
+                return None
+            return f"COMMENT ON TABLE {fqtable} IS '" + markdown.replace("'", "''") + "'"
 
         ANOMALO_HEADER = "**Anomalo Data Quality Checks**"
         ANOMALO_SEPARATOR = "\n\n---\n\n"
@@ -105,51 +513,24 @@ class databricks(AnomaloCatalogAdapter):
         else:
             new_comment = markdown
 
-        sql = f"COMMENT ON TABLE {fqtable} IS '" + new_comment.replace("'", "''") + "'"
-        self._run_sql(sql)
+        if self._is_prefetched(fqtable) and new_comment == existing_comment:
+            return None
+        return f"COMMENT ON TABLE {fqtable} IS '" + new_comment.replace("'", "''") + "'"
 
-    def _set_tags(self, fqtable: str, tags: list[str]):
+    def _set_tags_statement(self, fqtable: str, tags: list[str]) -> str:
+        if self._is_prefetched(fqtable):
+            existing_tags = self._table_tags.get(fqtable.lower(), {})
+            tags = [t for t in tags if existing_tags.get(t) != "y"]
         if not tags:
-            return
+            return None
         formatted_tags = ", ".join([f"'{t}' = 'y'" for t in tags])
-        self._run_sql(f"ALTER TABLE {fqtable} SET TAGS ({formatted_tags})")
+        return f"ALTER TABLE {fqtable} SET TAGS ({formatted_tags})"
 
-    def _delete_tags(self, fqtable: str, tags: list[str]):
+    def _delete_tags_statement(self, fqtable: str, tags: list[str]) -> str:
+        if self._is_prefetched(fqtable):
+            existing_tags = self._table_tags.get(fqtable.lower(), {})
+            tags = [t for t in tags if t in existing_tags]
         if not tags:
-            return
+            return None
         formatted_tags = ", ".join([f"'{t}'" for t in tags])
-        self._run_sql(f"ALTER TABLE {fqtable} UNSET TAGS ({formatted_tags})")
-
-    def _run_sql(self, sql: str):
-        if self._workspace_client:
-            return self._workspace_client.statement_execution.execute_statement(
-                statement=sql,
-                warehouse_id=self._dbx_warehouse_id,
-                wait_timeout="30s",
-            )
-        else:
-            payload = {
-                "statement": sql,
-                "wait_timeout": "5s",
-                "warehouse_id": self._dbx_warehouse_id,
-            }
-            headers = {
-                "Accept": "application/json",
-                "Authorization": "Bearer " + self._dbx_api_token,
-            }
-            response = requests.post(
-                self._dbx_rooturl + "/api/2.0/sql/statements/",
-                json=payload,
-                headers=headers,
-            )
-            response.raise_for_status()
-            statement_id = response.json()["statement_id"]
-
-            time.sleep(3)
-
-            response = requests.get(
-                self._dbx_rooturl + "/api/2.0/sql/statements/" + statement_id,
-                headers=headers,
-            )
-            response.raise_for_status()
-            return response.json()
+        return f"ALTER TABLE {fqtable} UNSET TAGS ({formatted_tags})"
@@ -1,8 +1,10 @@
 import json
 import os
+import threading
 
+import google.auth
 from anomalo_api import AnomaloTableSummary
-from google.api_core.exceptions import BadRequest, NotFound
+from google.api_core.exceptions import AlreadyExists, BadRequest, NotFound
 from google.cloud import bigquery, dataplex_v1
 from google.protobuf.field_mask_pb2 import FieldMask
 from google.protobuf.struct_pb2 import Struct
@@ -11,6 +13,8 @@ from adapters.base_adapter import AnomaloCatalogAdapter
 
 
 DATAPLEX_ANOMALO_ASPECT_ID = "anomalo-dq-status"
+# Column descriptions written by `--sync-columns` end with a line starting with this prefix
+COLUMN_STATUS_PREFIX = "Anomalo: "
 
 GOOGLE_APPLICATION_CREDENTIALS = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
 if not GOOGLE_APPLICATION_CREDENTIALS:
@@ -18,6 +22,21 @@ if not GOOGLE_APPLICATION_CREDENTIALS:
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
 
 
+def _parse_option_value(option_value: str) -> str:
+    """Decode a string option from INFORMATION_SCHEMA.TABLE_OPTIONS, which is a quoted SQL string literal"""
+    if option_value is None:
+        return None
+    for quote in ('"""', "'''", '"', "'"):
+        if (
+            len(option_value) >= 2 * len(quote)
+            and option_value.startswith(quote)
+            and option_value.endswith(quote)
+        ):
+            option_value = option_value[len(quote) : -len(quote)]
+            break
+    return option_value.encode("latin-1", "backslashreplace").decode("unicode_escape")
+
+
 class dataplex(AnomaloCatalogAdapter):
     def configure(self):
         super().configure()
@@ -30,12 +49,255 @@ class dataplex(AnomaloCatalogAdapter):
                 f"ERROR loading Google Service Account key from `{GOOGLE_APPLICATION_CREDENTIALS}`:"
             ) from e
 
+        # Credentials are loaded and clients are created once, and shared by all worker threads
+        self._credentials, self._default_project = google.auth.default(
+            scopes=["https://www.googleapis.com/auth/cloud-platform"]
+        )
+        self._bigquery_clients = {}
+        self._bigquery_clients_lock = threading.Lock()
+        self._catalog_client = dataplex_v1.CatalogServiceClient(
+            credentials=self._credentials
+        )
+
+        # Anomalo aspect type resolution per project/location, see `_ensure_aspect_type()`
+        self._aspect_types = {}
+        self._aspect_type_locks = {}
+        self._aspect_types_lock = threading.Lock()
+
+        # BigQuery table metadata of the current data source, see `prepare_warehouse()`
+        self._prefetched_tables = {}
+
+        # BigQuery table entries per project/location, see `_get_entry_index()`
+        self._entry_indexes = {}
+        self._entry_index_locks = {}
+        self._entry_indexes_lock = threading.Lock()
+
+    def _get_bigquery_client(self, project_id: str = None) -> bigquery.Client:
+        """BigQuery client for a project, created on first use; the credentials' default project if no project is given"""
+        project_id = project_id or self._default_project
+        with self._bigquery_clients_lock:
+            if project_id not in self._bigquery_clients:
+                self._bigquery_clients[project_id] = bigquery.Client(
+                    project=project_id, credentials=self._credentials
+                )
+            return self._bigquery_clients[project_id]
+
+    def _ensure_aspect_type(self, aspect_parent_path: str) -> bool:
+        """Make sure the Anomalo aspect type exists in a project/location, creating it if needed.
+
+        Resolved once per `aspect_parent_path` per run, and remembered across runs when a sync
+        state file is in use. Returns True if the aspect type is only known from a previous run.
+        """
+        with self._aspect_types_lock:
+            if aspect_parent_path in self._aspect_types:
+                return self._aspect_types[aspect_parent_path]
+            path_lock = self._aspect_type_locks.setdefault(
+                aspect_parent_path, threading.Lock()
+            )
+
+        # Workers resolving the same project/location wait for the first one
+        with path_lock:
+            if aspect_parent_path in self._aspect_types:
+                return self._aspect_types[aspect_parent_path]
+
+            aspect_type_path = (
+                f"{aspect_parent_path}/aspectTypes/{DATAPLEX_ANOMALO_ASPECT_ID}"
+            )
+            cache_key = f"aspect-type:{aspect_type_path}"
+            if self.sync_state and self.sync_state.get_cached(cache_key):
+                from_previous_run = True
+            else:
+                self._create_aspect_type(aspect_parent_path, aspect_type_path)
+                if self.sync_state:
+                    self.sync_state.set_cached(cache_key, aspect_type_path)
+                from_previous_run = False
+
+            with self._aspect_types_lock:
+                self._aspect_types[aspect_parent_path] = from_previous_run
+            return from_previous_run
+
+    def _forget_aspect_type(self, aspect_parent_path: str):
+        aspect_type_path = f"{aspect_parent_path}/aspectTypes/{DATAPLEX_ANOMALO_ASPECT_ID}"
+        with self._aspect_types_lock:
+            self._aspect_types.pop(aspect_parent_path, None)
+        if self.sync_state:
+            self.sync_state.delete_cached(f"aspect-type:{aspect_type_path}")
+
+    def _create_aspect_type(self, aspect_parent_path: str, aspect_type_path: str):
+        cat_client = self._catalog_client
+
+        # Does the aspect type already exist?
+        try:
+            aspect_type_res = cat_client.get_aspect_type(
+                request=dataplex_v1.GetAspectTypeRequest(name=aspect_type_path)
+            )
+        except NotFound:
+            aspect_type_res = None
+
+        if aspect_type_res:
+            return
+
+        print(f"Anomalo aspectType not found in Dataplex, attempting to create it...")
+
+        metadata_template = dataplex_v1.AspectType.MetadataTemplate()
+        metadata_template.type_ = "record"
+        metadata_template.name = "UserSchema"
+        metadata_template.record_fields.append(
+            dataplex_v1.types.AspectType.MetadataTemplate(
+                index=1,
+                name="anomalo-status",
+                type_="string",
+                annotations=dataplex_v1.types.AspectType.MetadataTemplate.Annotations(
+                    string_type="richText",
+                    display_name="DQ Status",
+                    display_order=1,
+                    description="Latest Data Quality status from Anomalo",
+                ),
+            )
+        )
+        aspect_type = dataplex_v1.AspectType()
+        aspect_type.display_name = "Anomalo"
+        aspect_type.description = "Anomalo Data Quality details"
+        aspect_type.metadata_template = metadata_template
+
+        aspect_request = dataplex_v1.CreateAspectTypeRequest(
+            parent=aspect_parent_path,
+            aspect_type_id=DATAPLEX_ANOMALO_ASPECT_ID,
+            aspect_type=aspect_type,
+        )
+
+        # create_aspect_type returns an Operation https://googleapis.dev/python/google-api-core/latest/operation.html
+        try:
+            aspect_type_res = cat_client.create_aspect_type(
+                request=aspect_request
+            ).result()
+            print(f"Registered Anomalo aspectType: {aspect_type_res}")
+        except AlreadyExists:
+            # created concurrently by another sync
+            print(f"Anomalo aspectType {aspect_type_path} already exists")
+
+    @staticmethod
+    def _entry_resource(project: str, dataset_id: str, table_id: str) -> str:
+        """Linked resource of a BigQuery table, as used in its Dataplex entry id"""
+        return f"bigquery.googleapis.com/projects/{project}/datasets/{dataset_id}/tables/{table_id}"
+
+    def _get_entry_index(self, project: str, location: str) -> dict:
+        """Index of the `@bigquery` entry group of a project/location, keyed by lowercase linked resource.
+
+        Entries are listed once per project/location on first use. Returns None if the entries
+        cannot be listed or `--no-prefetch` is set.
+        """
+        key = (project, location)
+        with self._entry_indexes_lock:
+            if key in self._entry_indexes:
+                return self._entry_indexes[key]
+            index_lock = self._entry_index_locks.setdefault(key, threading.Lock())
+
+        with index_lock:
+            if key in self._entry_indexes:
+                return self._entry_indexes[key]
+
+            index = None
+            if self._args.prefetch_catalog_state:
+                parent = f"projects/{project}/locations/{location}/entryGroups/@bigquery"
+                print(f"Listing Dataplex entries in {parent} ...")
+                try:
+                    index = {}
+                    for entry in self._catalog_client.list_entries(
+                        request=dataplex_v1.ListEntriesRequest(parent=parent)
+                    ):
+                        if "/entries/" in entry.name:
+                            index[entry.name.split("/entries/", 1)[1].lower()] = entry.name
+                    print(f"Found {len(index)} Dataplex entries in {parent}")
+                except Exception as e:
+                    print(
+                        f"WARNING Cannot list Dataplex entries in {parent}, looking up tables one at a time: {e}"
+                    )
+                    index = None
+
+            with self._entry_indexes_lock:
+                self._entry_indexes[key] = index
+            return index
+
+    def _find_entry_name(self, gcp_table: bigquery.Table) -> str:
+        """Name of the Dataplex entry of a BigQuery table, or None if it has no entry"""
+        project = gcp_table.project
+        location = (gcp_table.location or "global").lower()
+        resource = self._entry_resource(project, gcp_table.dataset_id, gcp_table.table_id)
+
+        index = self._get_entry_index(project, location)
+        if index is not None and resource.lower() in index:
+            return index[resource.lower()]
+
+        # Not listed (e.g. created since the listing), so look the entry up by its well-known name
+        parent = f"projects/{project}/locations/{location}"
+        try:
+            return self._catalog_client.lookup_entry(
+                request=dataplex_v1.LookupEntryRequest(
+                    name=parent,
+                    entry=f"{parent}/entryGroups/@bigquery/entries/{resource}",
+                )
+            ).name
+        except NotFound:
+            return None
+
+    def prepare_warehouse(self, warehouse, configured_tables):
+        self._prefetched_tables = {}
+        if not self._args.prefetch_catalog_state:
+            return
+        project_id = warehouse.get("project_id")
+        client = self._get_bigquery_client(project_id)
+        project = project_id or client.project
+        datasets = sorted(
+            {
+                t["table"]["full_name"].split(".")[-2]
+                for t in configured_tables
+                if "." in t["table"]["full_name"]
+            }
+        )
+
+        print(f"  Prefetching descriptions and labels for {len(datasets)} datasets...")
+        for dataset_id in datasets:
+            try:
+                dataset = client.get_dataset(f"{project}.{dataset_id}")
+                descriptions = {
+                    row.table_name: _parse_option_value(row.option_value)
+                    for row in client.query(
+                        f"SELECT table_name, option_value FROM `{project}.{dataset_id}`.INFORMATION_SCHEMA.TABLE_OPTIONS"
+                        " WHERE option_name = 'description'",
+                        location=dataset.location,
+                    ).result()
+                }
+                for item in client.list_tables(dataset):
+                    table_ref = f"{project}.{dataset_id}.{item.table_id}"
+                    self._prefetched_tables[table_ref] = bigquery.Table.from_api_repr(
+                        {
+                            "tableReference": {
+                                "projectId": project,
+                                "datasetId": dataset_id,
+                                "tableId": item.table_id,
+                            },
+                            "id": f"{project}:{dataset_id}.{item.table_id}",
+                            "location": dataset.location,
+                            "description": descriptions.get(item.table_id),
+                            "labels": dict(item.labels or {}),
+                        }
+                    )
+            except Exception as e:
+                print(
+                    f"    WARNING: Could not prefetch tables in dataset `{dataset_id}`, reading them one at a time: {e}"
+                )
+        print(f"  Prefetched {len(self._prefetched_tables)} tables")
+
     def update_catalog_asset(
         self, warehouse: dict[str, str], table_summary: AnomaloTableSummary
     ) -> bool:
-        client = bigquery.Client()
-
         project_id = warehouse.get("project_id")
+        client = self._get_bigquery_client(project_id)
+
+        # Render the description and aspect text in one pass
+        status_texts = table_summary.get_status_texts("plaintext", "purview")
+
         dataset_id = table_summary.table_full_name.split(".")[-2]
         table_id = table_summary.table_full_name.split(".")[-1]
         table_ref = (
@@ -44,21 +306,27 @@ class dataplex(AnomaloCatalogAdapter):
             else f"{dataset_id}.{table_id}"
         )
 
-        try:
-            gcp_table = client.get_table(table_ref)
-            if not gcp_table:
-                raise Exception(f"Table `{table_ref}` not found")
-        except:
-            print(
-                f"ERROR Cannot find table `{table_ref}` from data source `{warehouse['name']}` ({warehouse['id']})"
-            )
-            return False
+        gcp_table = self._prefetched_tables.get(
+            table_ref if project_id else f"{client.project}.{table_ref}"
+        )
+        if gcp_table is None:
+            try:
+                gcp_table = client.get_table(table_ref)
+                if not gcp_table:
+                    raise Exception(f"Table `{table_ref}` not found")
+            except:
+                print(
+                    f"ERROR Cannot find table `{table_ref}` from data source `{warehouse['name']}` ({warehouse['id']})"
+                )
+                return False
+        current_description = gcp_table.description
+        current_labels = dict(gcp_table.labels)
 
         # Update BigQuery table description with plaintext DQ status
         if self._args.update_table_description:
             # Add a well-known footer to the status text block so we can non-destructively update the table description
             status_text = (
-                table_summary.get_status_text(dialect="plaintext").strip() + "\n======"
+                status_texts["plaintext"].strip() + "\n======"
             )
             if gcp_table.description:
                 # Update description non-destructively
@@ -95,7 +363,13 @@ class dataplex(AnomaloCatalogAdapter):
                 ):  # GCP only supports lower case letters
                     # See https://cloud.google.com/bigquery/docs/deleting-labels#python
                     gcp_table.labels[t.lower()] = None
-        if self._args.update_labels or self._args.update_table_description:
+        unchanged = gcp_table.description == current_description and {
+            k: v for k, v in gcp_table.labels.items() if v is not None
+        } == current_labels
+        update_bigquery = self._args.update_labels or self._args.update_table_description
+        if update_bigquery and unchanged:
+            print(f"Description and labels of `{table_ref}` are already up to date")
+        elif update_bigquery:
             try:
                 client.update_table(gcp_table, ["description", "labels"])
                 print(
@@ -115,110 +389,127 @@ using the BigQuery Data Editor role `roles/bigquery.dataEditor` or a custom role
                 return False
 
         if self._args.update_aspect:
-            # Ensure aspect type exists in this table's project and location
             full_name = gcp_table.full_table_id
-            project = gcp_table.project
-            dataset_id = gcp_table.dataset_id
-
-            cat_client = dataplex_v1.CatalogServiceClient()
-
-            match_key = f"/{full_name.replace(':', '.').split('.')[-2]}/tables/{full_name.split('.')[-1]}".lower()
-
-            print(
-                f"Searching for {full_name.split('.', 1)[-1]} using matchkey '{match_key}'"
-            )
-            search_req = dataplex_v1.SearchEntriesRequest(
-                name=f"projects/{project}/locations/global",
-                query=full_name.split(".", 1)[-1],
-            )
-            search_res = cat_client.search_entries(request=search_req)
-
-            found_entity = None
-            for res in search_res:
-                if res.linked_resource.lower().endswith(match_key):
-                    found_entity = res.dataplex_entry
-                    break
-
-            print(
-                f"Matched BigQuery asset {full_name} to DataPlex name {found_entity.name}"
-            )
-            if found_entity:
-                aspect_parent_path = found_entity.name.split("/entryGroups")[0]
-                aspect_type_path = (
-                    f"{aspect_parent_path}/aspectTypes/{DATAPLEX_ANOMALO_ASPECT_ID}"
-                )
-
-                # Does the aspect type already exist?
+            # an entry name recorded by a previous run (see `--state-file`) saves looking it up
+            entry_name = table_summary.catalog_asset_id
+            if entry_name:
                 try:
-                    aspect_type_res = cat_client.get_aspect_type(
-                        request=dataplex_v1.GetAspectTypeRequest(name=aspect_type_path)
-                    )
+                    self._update_entry_aspect(entry_name, status_texts["purview"])
                 except NotFound:
-                    aspect_type_res = None
-
-                if not aspect_type_res:
                     print(
-                        f"Anomalo aspectType not found in Dataplex, attempting to create it..."
-                    )
-
-                    metadata_template = dataplex_v1.AspectType.MetadataTemplate()
-                    metadata_template.type_ = "record"
-                    metadata_template.name = "UserSchema"
-                    metadata_template.record_fields.append(
-                        dataplex_v1.types.AspectType.MetadataTemplate(
-                            index=1,
-                            name="anomalo-status",
-                            type_="string",
-                            annotations=dataplex_v1.types.AspectType.MetadataTemplate.Annotations(
-                                string_type="richText",
-                                display_name="DQ Status",
-                                display_order=1,
-                                description="Latest Data Quality status from Anomalo",
-                            ),
-                        )
+                        f"Dataplex entry {entry_name} recorded by the previous sync was not found, looking it up again"
                     )
-                    aspect_type = dataplex_v1.AspectType()
-                    aspect_type.display_name = "Anomalo"
-                    aspect_type.description = "Anomalo Data Quality details"
-                    aspect_type.metadata_template = metadata_template
-
-                    aspect_request = dataplex_v1.CreateAspectTypeRequest(
-                        parent=aspect_parent_path,
-                        aspect_type_id=DATAPLEX_ANOMALO_ASPECT_ID,
-                        aspect_type=aspect_type,
+                    entry_name = None
+            if not entry_name:
+                entry_name = self._find_entry_name(gcp_table)
+                if entry_name:
+                    print(
+                        f"Matched BigQuery asset {full_name} to DataPlex name {entry_name}"
                     )
+                    self._update_entry_aspect(entry_name, status_texts["purview"])
+            if entry_name:
+                table_summary.catalog_asset_id = entry_name
+            else:
+                print(
+                    f"WARNING Cannot find Dataplex entry for {full_name}, will not update Dataplex status"
+                )
 
-                    # create_aspect_type returns an Operation https://googleapis.dev/python/google-api-core/latest/operation.html
-                    aspect_type_res = cat_client.create_aspect_type(
-                        request=aspect_request
-                    ).result()
-                    print(f"Registered Anomalo aspectType: {aspect_type_res}")
+        return True
 
-                # FML :facepalm:
-                # 400 error. Invalid map key projects/935953212207/locations/us/aspectTypes/anomalo-dq-status for the Aspects map. The proper format is "project.location.aspectType"
-                dplx_path = aspect_parent_path.replace("projects/", "").replace(
-                    "/locations/", "."
-                )
-                aspect_name = f"{dplx_path}.{DATAPLEX_ANOMALO_ASPECT_ID}"
+    def _update_entry_aspect(self, entry_name: str, status_text: str):
+        """Replace the Anomalo aspect of a Dataplex entry, leaving its other aspects alone"""
+        # A fresh Entry with just the name, since only the Anomalo aspect is updated
+        entry = dataplex_v1.Entry(name=entry_name)
+        aspect_parent_path = entry_name.split("/entryGroups")[0]
+        from_previous_run = self._ensure_aspect_type(aspect_parent_path)
 
-                # Love me some manually-crafted protobuf
-                aspect_data = Struct()
-                aspect_data["anomalo-status"] = table_summary.get_status_text(
-                    dialect="purview"
-                )
+        # FML :facepalm:
+        # 400 error. Invalid map key projects/935953212207/locations/us/aspectTypes/anomalo-dq-status for the Aspects map. The proper format is "project.location.aspectType"
+        dplx_path = aspect_parent_path.replace("projects/", "").replace(
+            "/locations/", "."
+        )
+        aspect_name = f"{dplx_path}.{DATAPLEX_ANOMALO_ASPECT_ID}"
 
-                found_entity.aspects[aspect_name] = dataplex_v1.types.Aspect(
-                    data=aspect_data,
-                )
+        # Love me some manually-crafted protobuf
+        aspect_data = Struct()
+        aspect_data["anomalo-status"] = status_text
+
+        entry.aspects[aspect_name] = dataplex_v1.types.Aspect(
+            data=aspect_data,
+        )
+
+        update_request = dataplex_v1.UpdateEntryRequest(
+            entry=entry,
+            update_mask=FieldMask(paths=["aspects"]),
+            aspect_keys=[aspect_name],
+        )
+        try:
+            self._catalog_client.update_entry(request=update_request)
+        except (BadRequest, NotFound):
+            if not from_previous_run:
+                raise
+            # The aspect type was only known from a previous run; it may have been deleted since
+            self._forget_aspect_type(aspect_parent_path)
+            self._ensure_aspect_type(aspect_parent_path)
+            self._catalog_client.update_entry(request=update_request)
+        print(f"Update entry.aspects[{aspect_name}] on {entry_name}")
+
+    def update_catalog_columns(
+        self, warehouse: dict[str, str], table_summary: AnomaloTableSummary, column_statuses
+    ) -> bool:
+        """Write each checked column's DQ status to its BigQuery column description, with one table update"""
+        project_id = warehouse.get("project_id")
+        client = self._get_bigquery_client(project_id)
+        dataset_id, table_id = table_summary.table_full_name.split(".")[-2:]
+        table_ref = (
+            f"{project_id}.{dataset_id}.{table_id}"
+            if project_id
+            else f"{dataset_id}.{table_id}"
+        )
+        try:
+            # prefetched tables don't have a schema, and the schema is the column index
+            gcp_table = client.get_table(table_ref)
+        except Exception as e:
+            print(f"ERROR Cannot read the schema of `{table_ref}`: {e}")
+            return False
 
-                update_request = dataplex_v1.UpdateEntryRequest(
-                    entry=found_entity, update_mask=FieldMask(paths=["aspects"])
+        statuses = {name.lower(): status for name, status in column_statuses.items()}
+        schema = []
+        changed = 0
+        for field in gcp_table.schema:
+            status = statuses.pop(field.name.lower(), None)
+            description = field.description
+            if status is not None:
+                description = self._column_description(
+                    field.description, status.get_status_text("plaintext")
                 )
-                update_res = cat_client.update_entry(request=update_request)
-                print(f"Update entry.aspects[{aspect_name}] on {found_entity.name}")
-            else:
-                print(
-                    f"WARNING Cannot find Dataplex entry for {full_name}, will not update Dataplex status"
+            if description != field.description:
+                field = bigquery.SchemaField.from_api_repr(
+                    dict(field.to_api_repr(), description=description)
                 )
+                changed += 1
+            schema.append(field)
+        if statuses:
+            print(
+                f"WARNING Columns not found in `{table_ref}`: {', '.join(s.column_name for s in statuses.values())}"
+            )
+        if not changed:
+            print(f"Column descriptions of `{table_ref}` are already up to date")
+            return True
 
+        gcp_table.schema = schema
+        try:
+            client.update_table(gcp_table, ["schema"])
+        except Exception as e:
+            print(f"ERROR Updating column descriptions of `{table_ref}` failed: {e}")
+            return False
+        print(f"Updated {changed} column descriptions of `{table_ref}`")
         return True
+
+    @staticmethod
+    def _column_description(description: str, status_text: str) -> str:
+        """Replace the Anomalo status line at the end of a column description, keeping the rest"""
+        lines = (description or "").split("\n")
+        if lines and lines[-1].startswith(COLUMN_STATUS_PREFIX):
+            lines = lines[:-1]
+        return "\n".join(lines + [status_text]).strip()
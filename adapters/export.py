@@ -1,5 +1,291 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+from anomalo_api import CHECK_CATEGORIES, AnomaloCheckRecord, AnomaloTableSummary
+
 from adapters.base_adapter import AnomaloCatalogAdapter
 
 
+# Records are written in chunks of this many records (one Parquet row group per chunk)
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_BUFFER_SIZE = 1024 * 1024
+
+
+class ExportWriter:
+    """Writes records in chunks to a temporary file next to `path`, renamed into place by `close()`"""
+
+    def __init__(self, path: str, format: str, compression: str, schema=None):
+        self.path = path
+        self._format = format
+        self._lock = threading.Lock()
+        self._chunk = []
+        self.record_count = 0
+
+        fd, self._tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)),
+            prefix=f".{os.path.basename(path)}.",
+            suffix=".tmp",
+        )
+        self._file = os.fdopen(fd, "wb", buffering=EXPORT_BUFFER_SIZE)
+        try:
+            if format == "parquet":
+                import pyarrow
+                import pyarrow.parquet
+
+                self._pa = pyarrow
+                self._writer = pyarrow.parquet.ParquetWriter(
+                    self._file,
+                    schema,
+                    compression=None if compression == "none" else compression,
+                )
+            elif compression == "gzip":
+                self._writer = gzip.GzipFile(fileobj=self._file, mode="wb")
+            else:
+                self._writer = self._file
+        except Exception:
+            self._file.close()
+            os.remove(self._tmp_path)
+            raise
+
+    def write(self, records: list[dict]):
+        with self._lock:
+            self._chunk.extend(records)
+            if len(self._chunk) >= EXPORT_CHUNK_SIZE:
+                self._write_chunk()
+
+    def close(self, completed: bool = True):
+        with self._lock:
+            try:
+                if completed:
+                    self._write_chunk()
+                self._writer.close()
+                if self._writer is not self._file:
+                    self._file.close()
+            except Exception:
+                os.remove(self._tmp_path)
+                raise
+        if not completed:
+            os.remove(self._tmp_path)
+            return
+        # mkstemp creates the file readable only by its owner; give it the usual permissions
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(self._tmp_path, 0o666 & ~umask)
+        os.replace(self._tmp_path, self.path)
+
+    def _write_chunk(self):
+        """Write the buffered records; the caller holds `self._lock`"""
+        if not self._chunk:
+            return
+        if self._format == "parquet":
+            self._writer.write_table(
+                self._pa.Table.from_pylist(self._chunk, schema=self._writer.schema)
+            )
+        else:
+            self._writer.write(
+                "".join(
+                    json.dumps(record, ensure_ascii=False) + "\n"
+                    for record in self._chunk
+                ).encode("utf-8")
+            )
+        self.record_count += len(self._chunk)
+        self._chunk = []
+
+
 class export(AnomaloCatalogAdapter):
-    pass
+    """Streams one record per table to a JSON Lines or Parquet file.
+
+    Records are written in chunks to a temporary file next to the output file, which is
+    renamed into place when the run completes, so readers never see a partial export.
+    With `--sync-checks`, one record per check is written to a second file the same way.
+    """
+
+    def configure(self):
+        super().configure()
+        # `close()` is called even if configuring fails part way
+        self._tables = self._checks = None
+        if getattr(self._args, "skip_unchanged", False) or getattr(
+            self._args, "incremental", False
+        ):
+            # skipped tables have no summary, so they would be missing from the new export file
+            raise ValueError(
+                "--skip-unchanged and --incremental are not supported with --catalog export; every export file has all tables"
+            )
+        self._format = self._args.export_format
+        path = self._args.export_file or (
+            f"anomalo-dq-export-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.{self._format}"
+        )
+        self._compression = self._args.export_compression
+        if self._compression is None:
+            self._compression = "snappy" if self._format == "parquet" else "none"
+        if self._format == "jsonl" and self._compression not in ("none", "gzip"):
+            raise ValueError(
+                f"--export-compression {self._compression} is only supported for parquet exports"
+            )
+        if (
+            self._format == "jsonl"
+            and self._compression == "gzip"
+            and not path.endswith(".gz")
+        ):
+            path += ".gz"
+
+        if self._format == "parquet":
+            try:
+                import pyarrow
+            except ImportError as e:
+                raise ImportError(
+                    "--export-format parquet requires pyarrow; run `pip install pyarrow`"
+                ) from e
+            self._pa = pyarrow
+
+        self._exported_at = datetime.now(timezone.utc).isoformat()
+        self._tables = self._open_writer(path, self._table_parquet_schema)
+        if getattr(self._args, "sync_checks", False):
+            self._checks = self._open_writer(
+                self._checks_path(path), self._check_parquet_schema
+            )
+        print(
+            f"Exporting DQ status to `{self._tables.path}` ({self._format}, compression: {self._compression})"
+        )
+        if self._checks:
+            print(f"Exporting check status to `{self._checks.path}`")
+
+    def _open_writer(self, path: str, parquet_schema) -> ExportWriter:
+        return ExportWriter(
+            path,
+            self._format,
+            self._compression,
+            schema=parquet_schema() if self._format == "parquet" else None,
+        )
+
+    @staticmethod
+    def _checks_path(path: str) -> str:
+        """`dq.parquet` -> `dq.checks.parquet`, `dq.jsonl.gz` -> `dq.checks.jsonl.gz`"""
+        root, ext = os.path.splitext(path)
+        if ext == ".gz":
+            root, inner_ext = os.path.splitext(root)
+            ext = inner_ext + ext
+        return f"{root}.checks{ext}"
+
+    def update_catalog_asset(
+        self, warehouse: dict[str, str], table_summary: AnomaloTableSummary
+    ) -> bool:
+        self._tables.write([self._export_record(warehouse, table_summary)])
+        print(f"Exported {table_summary.table_full_name} ({table_summary.table_id})")
+        return True
+
+    def update_catalog_checks(
+        self, warehouse: dict[str, str], table_summary: AnomaloTableSummary, check_records
+    ) -> bool:
+        table_fields = {
+            "exported_at": self._exported_at,
+            "warehouse_id": warehouse["id"],
+            "table_id": table_summary.table_id,
+            "table_full_name": table_summary.table_full_name,
+            "job_id": table_summary.job_id,
+        }
+        check_count = 0
+        for records in self._chunks(check_records, EXPORT_CHUNK_SIZE):
+            self._checks.write([dict(table_fields, **r.as_dict()) for r in records])
+            check_count += len(records)
+        print(f"Exported {check_count} checks of {table_summary.table_full_name}")
+        return True
+
+    def close(self, completed: bool = True):
+        error = None
+        for writer in (self._tables, self._checks):
+            if writer is None:
+                continue
+            try:
+                writer.close(completed)
+            except Exception as e:
+                # still close the other file so its temporary file is removed
+                error = error or e
+                continue
+            if completed:
+                print(f"Exported {writer.record_count} records to `{writer.path}`")
+            else:
+                print(f"Sync did not complete, discarded export to `{writer.path}`")
+        if error:
+            raise error
+
+    def _export_record(
+        self, warehouse: dict[str, str], summary: AnomaloTableSummary
+    ) -> dict:
+        record = {
+            "exported_at": self._exported_at,
+            "warehouse_id": warehouse["id"],
+            "warehouse_name": warehouse["name"],
+            "table_id": summary.table_id,
+            "table_full_name": summary.table_full_name,
+            "anomalo_table_url": summary.anomalo_table_url,
+            "job_id": summary.job_id,
+            "table_passed": summary.table_passed,
+            "to_checks_failed": summary.to_checks_failed,
+            "dq_checks_failed": summary.dq_checks_failed,
+            "checks_errored": summary.checks_errored,
+            "checks_skipped": summary.checks_skipped,
+        }
+        record.update(summary.get_check_counts())
+        # only set with --history-days
+        history = summary.history
+        record["history_days_with_runs"] = history.days_with_runs if history else None
+        record["history_days_failed"] = history.days_failed if history else None
+        record["history_pass_rate"] = history.pass_rate if history else None
+        record["history_failing_streak"] = history.failing_streak if history else None
+        record["tags_to_apply"] = summary.get_tags_to_apply()
+        record["tags_to_remove"] = summary.get_tags_to_remove()
+        return record
+
+    def _table_parquet_schema(self):
+        pa = self._pa
+        fields = [
+            ("exported_at", pa.string()),
+            ("warehouse_id", pa.int64()),
+            ("warehouse_name", pa.string()),
+            ("table_id", pa.int64()),
+            ("table_full_name", pa.string()),
+            ("anomalo_table_url", pa.string()),
+            ("job_id", pa.int64()),
+            ("table_passed", pa.bool_()),
+            ("to_checks_failed", pa.bool_()),
+            ("dq_checks_failed", pa.bool_()),
+            ("checks_errored", pa.int64()),
+            ("checks_skipped", pa.int64()),
+        ]
+        for category, _, _ in CHECK_CATEGORIES:
+            fields += [
+                (f"{category}_total", pa.int64()),
+                (f"{category}_pass", pa.int64()),
+                (f"{category}_fail", pa.int64()),
+            ]
+        fields += [
+            ("history_days_with_runs", pa.int64()),
+            ("history_days_failed", pa.int64()),
+            ("history_pass_rate", pa.float64()),
+            ("history_failing_streak", pa.int64()),
+            ("tags_to_apply", pa.list_(pa.string())),
+            ("tags_to_remove", pa.list_(pa.string())),
+        ]
+        return pa.schema(fields)
+
+    def _check_parquet_schema(self):
+        pa = self._pa
+        fields = [
+            ("exported_at", pa.string()),
+            ("warehouse_id", pa.int64()),
+            ("table_id", pa.int64()),
+            ("table_full_name", pa.string()),
+            ("job_id", pa.int64()),
+        ]
+        # check ids are Anomalo ids; everything else about a check is text
+        field_types = {"check_id": pa.int64(), "columns": pa.list_(pa.string())}
+        fields += [
+            (field, field_types.get(field, pa.string()))
+            for field in AnomaloCheckRecord.__slots__
+        ]
+        return pa.schema(fields)
@@ -0,0 +1,137 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+
+# Statuses that mean the request was not processed and can always be retried
+RETRY_ANY_METHOD_STATUSES = (429, 503)
+# Statuses that are only retried for idempotent methods
+RETRY_IDEMPOTENT_STATUSES = (500, 502, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+class HttpClient:
+    """Shared HTTP session for catalog adapters.
+
+    Keeps connections alive in a pool shared by all worker threads, retries throttled and
+    failed requests with exponential backoff and jitter (honouring `Retry-After`), and limits
+    the number of concurrent requests to each host. Requests that are not idempotent are only
+    retried if the server did not process them, e.g. when throttled or the connection failed.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 16,
+        max_requests_per_host: int = 8,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 60,
+        timeout: float = 120,
+    ):
+        self.max_requests_per_host = max_requests_per_host
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0
+        )
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        self._host_limits = {}
+        self._host_limits_lock = threading.Lock()
+
+    def _host_limit(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(
+                    self.max_requests_per_host
+                )
+            return self._host_limits[host]
+
+    def _retry_delay(self, attempt: int, response: requests.Response = None) -> float:
+        """Exponential backoff with full jitter up to `max_backoff`, but never less than the server's `Retry-After`"""
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                try:
+                    retry_at = parsedate_to_datetime(retry_after)
+                    delay = max(
+                        delay, (retry_at - datetime.now(timezone.utc)).total_seconds()
+                    )
+                except (TypeError, ValueError):
+                    pass
+        return delay
+
+    @staticmethod
+    def _not_sent(error: Exception) -> bool:
+        """Whether a failed request never reached the server, e.g. the connection was refused or timed out"""
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def _should_retry(self, idempotent: bool, response: requests.Response) -> bool:
+        if response.status_code in RETRY_ANY_METHOD_STATUSES:
+            return True
+        return idempotent and response.status_code in RETRY_IDEMPOTENT_STATUSES
+
+    def request(
+        self, method: str, url: str, idempotent: bool = None, **kwargs
+    ) -> requests.Response:
+        """Send a request, retrying it as described above.
+
+        `idempotent` defaults to whether the method is; pass True for e.g. read-only POST queries.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        kwargs.setdefault("timeout", self.timeout)
+        host_limit = self._host_limit(url)
+        attempt = 0
+        while True:
+            try:
+                with host_limit:
+                    response = self._session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # e.g. a read timeout after a POST was sent; retrying could apply it twice
+                if attempt >= self.max_retries or not (idempotent or self._not_sent(e)):
+                    raise
+                delay = self._retry_delay(attempt)
+                print(f"    WARNING: {method} {url} failed ({e}), retrying in {delay:.1f}s")
+            else:
+                if attempt >= self.max_retries or not self._should_retry(
+                    idempotent, response
+                ):
+                    return response
+                delay = self._retry_delay(attempt, response)
+                print(
+                    f"    WARNING: {method} {url} returned {response.status_code}, retrying in {delay:.1f}s"
+                )
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
@@ -1,13 +1,33 @@
 import json
 import os
+import re
 from urllib.parse import urlparse
 
-import requests
 from anomalo_api import AnomaloTableSummary
 
 from adapters.base_adapter import AnomaloCatalogAdapter
 
 
+# e.g. databricks://<workspace id>/catalogs/<catalog>/schemas/<schema>/tables/<table>
+DATABRICKS_QUALIFIED_NAME = re.compile(
+    r"/catalogs/(?P<catalog>[^/]+)/schemas/(?P<schema>[^/]+)/tables/(?P<table>[^/]+)/?$",
+    re.IGNORECASE,
+)
+
+# index value for a key that matches more than one Purview asset
+AMBIGUOUS_ASSET = object()
+
+# https://learn.microsoft.com/en-us/rest/api/purview/datamapdataplane/discovery/query
+PURVIEW_SEARCH_PAGE_SIZE = 1000
+
+DATAMAP_API_VERSION = "2023-09-01"
+ENDORSEMENT_CLASSIFICATION = "MICROSOFT.POWERBI.ENDORSEMENT"
+# column entities per bulk entity update with --sync-columns
+PURVIEW_COLUMN_BULK_SIZE = 500
+# GUIDs per bulk entity read; they are sent in the query string, so this keeps URLs short
+PURVIEW_BULK_READ_SIZE = 100
+
+
 class purview(AnomaloCatalogAdapter):
     def configure(self):
         print(f"Initializing {self.__class__.__name__} integration...")
@@ -43,7 +63,7 @@ class purview(AnomaloCatalogAdapter):
                 "grant_type": "client_credentials",
                 "resource": "https://purview.azure.net",
             }
-            _response = requests.post(_login_url, data=_params)
+            _response = self.http.post(_login_url, data=_params)
             _data = _response.json()
             _token = _data["access_token"]
             self.api_headers = {
@@ -55,20 +75,106 @@ class purview(AnomaloCatalogAdapter):
                 "Error getting Purview access token from Entra, please check your Entra config and credentials."
             ) from e
 
+        # Optional comma-separated qualified name prefixes to restrict asset discovery to, e.g. databricks://<workspace id>
+        self._qualified_name_prefixes = [
+            p.strip().rstrip("/")
+            for p in os.environ.get("PURVIEW_QUALIFIED_NAME_PREFIXES", "").split(",")
+            if p.strip()
+        ]
+
         self._register_purview_typedefs(self._args.force_update_typedefs)
-        self.asset_list = self._get_purview_asset_list()
+        self.asset_index = {}
+        self._discovered_catalogs = set()
+        # asset GUIDs recorded in the sync state by previous runs that still exist
+        self._verified_uids = set()
+
+    def prepare_warehouse(self, warehouse, configured_tables):
+        """Discover the Purview assets for the data source's Databricks catalog, once per catalog.
+
+        Discovery is skipped if every table has an asset GUID from a previous run (see `--state-file`)
+        that still exists; those are checked with bulk entity reads.
+        """
+        if self._verify_recorded_uids(warehouse, configured_tables):
+            print(
+                f"Using the Purview assets recorded for data source `{warehouse['name']}` by the previous sync"
+            )
+            return
+        catalog = self._get_catalog_name(warehouse)
+        if catalog in self._discovered_catalogs or None in self._discovered_catalogs:
+            return
+        self._discovered_catalogs.add(catalog)
+
+        if catalog:
+            if self._qualified_name_prefixes:
+                name_filters = [
+                    {
+                        "attributeName": "qualifiedName",
+                        "operator": "startswith",
+                        "attributeValue": f"{prefix}/catalogs/{catalog}/",
+                    }
+                    for prefix in self._qualified_name_prefixes
+                ]
+            else:
+                name_filters = [
+                    {
+                        "attributeName": "qualifiedName",
+                        "operator": "contains",
+                        "attributeValue": f"/catalogs/{catalog}/",
+                    }
+                ]
+        else:
+            name_filters = [
+                {
+                    "attributeName": "qualifiedName",
+                    "operator": "startswith",
+                    "attributeValue": prefix,
+                }
+                for prefix in self._qualified_name_prefixes
+            ]
+
+        print(
+            f"Discovering Purview assets for catalog `{catalog or '*'}` of data source `{warehouse['name']}`..."
+        )
+        asset_count = 0
+        for asset in self._discover_purview_assets(name_filters):
+            self._index_asset(asset)
+            asset_count += 1
+        print(f"Discovered {asset_count} Purview assets")
+
+    def _verify_recorded_uids(self, warehouse, configured_tables) -> bool:
+        """Check which recorded asset GUIDs of the tables still exist; True if all tables have one"""
+        if not self.sync_state or not configured_tables:
+            return False
+        recorded = []
+        for table in configured_tables:
+            state = self.sync_state.get(warehouse["id"], table["table"]["id"])
+            if state and state["catalog_asset_id"]:
+                recorded.append(state["catalog_asset_id"])
+        if not recorded:
+            return False
+        try:
+            existing = set(self._get_entities(recorded))
+        except Exception as e:
+            print(f"WARNING Cannot read the Purview assets recorded by the previous sync: {e}")
+            return False
+        self._verified_uids |= existing
+        return len(recorded) == len(configured_tables) and existing.issuperset(recorded)
 
     def update_catalog_asset(
         self, warehouse: dict[str, str], table_summary: AnomaloTableSummary
     ) -> bool:
         """Update the Purview asset with Anomalo metadata."""
-        p_uid = self._get_purview_uid(
-            table_summary.table_full_name.split(".")[1], self.asset_list
-        )
+        p_uid = table_summary.catalog_asset_id
+        if p_uid not in self._verified_uids:
+            p_uid = self._get_purview_uid(warehouse, table_summary.table_full_name)
         if p_uid:
+            table_summary.catalog_asset_id = p_uid
             print(
                 f"FOUND table {table_summary.table_full_name} ({table_summary.table_id}) with Purview asset id {p_uid}; SYNCING..."
             )
+            if self._args.batch_size > 0:
+                self._queue_update(table_summary.table_id, (p_uid, table_summary))
+                return None
             self._update_purview(p_uid, table_summary)
             return True
         else:
@@ -77,22 +183,163 @@ class purview(AnomaloCatalogAdapter):
             )
             return False
 
-    def _get_purview_asset_list(self):
-        # TODO migrate this to GA api 2023-09-01
-        _discovery_url = (
-            f"{self.purview_rooturl}/catalog/api/browse?api-version=2023-02-01-preview"
-        )
-        _discovery_body = """{"entityType": "databricks_table"}"""
+    def update_catalog_columns(
+        self, warehouse: dict[str, str], table_summary: AnomaloTableSummary, column_statuses
+    ) -> bool:
+        """Write each checked column's DQ status to the AnomaloDQ business metadata of its column asset.
+
+        The table's column assets are read with one entity call, and their business metadata is
+        written with bulk entity updates of up to PURVIEW_COLUMN_BULK_SIZE columns.
+        """
+        if not self._args.update_aspect:
+            return True
+        uid = table_summary.catalog_asset_id
+        try:
+            columns = self._get_column_index(uid)
+        except Exception as e:
+            print(f"ERROR reading the column assets of Purview asset {uid}: {e}")
+            return False
+
+        updates = []
+        missing = []
+        for column_name, column_status in column_statuses.items():
+            column = columns.get(column_name.lower())
+            if column is None:
+                missing.append(column_name)
+                continue
+            updates.append(
+                {
+                    "typeName": column["typeName"],
+                    "guid": column["guid"],
+                    "attributes": {
+                        "qualifiedName": column["attributes"]["qualifiedName"],
+                        "name": column["attributes"].get("name"),
+                    },
+                    "businessAttributes": {
+                        "AnomaloDQ": {
+                            "AnomaloChecks": column_status.get_status_text("purview")
+                        }
+                    },
+                }
+            )
+        if missing:
+            print(
+                f"WARNING columns not found in Purview asset {uid}: {', '.join(missing)}"
+            )
+
+        bulk_url = f"{self.purview_rooturl}/datamap/api/atlas/v2/entity/bulk"
+        for entities in self._chunks(updates, PURVIEW_COLUMN_BULK_SIZE):
+            response = self.http.post(
+                bulk_url,
+                params={
+                    "api-version": DATAMAP_API_VERSION,
+                    "businessAttributeUpdateBehavior": "merge",
+                },
+                data=json.dumps({"entities": entities}),
+                headers=self.api_headers,
+            )
+            if not response.ok:
+                print(
+                    f"ERROR updating {len(entities)} column assets of Purview asset {uid}: {response.status_code} {response.text}"
+                )
+                return False
+        print(f"Updated DQ status of {len(updates)} column assets")
+        return True
 
-        response = requests.post(
-            _discovery_url, data=_discovery_body, headers=self.api_headers
+    def _get_column_index(self, uid: str) -> dict:
+        """Column assets of a table asset by lower-case column name, from one entity read"""
+        response = self.http.get(
+            f"{self.purview_rooturl}/datamap/api/atlas/v2/entity/guid/{uid}",
+            params={"api-version": DATAMAP_API_VERSION},
+            headers=self.api_headers,
         )
-        return response.json()
+        response.raise_for_status()
+        result = response.json()
+        # the table's columns are returned in full as referred entities
+        referred = result.get("referredEntities") or {}
+        columns = {}
+        for related in result["entity"].get("relationshipAttributes", {}).get("columns") or []:
+            column = referred.get(related.get("guid"))
+            if column and column.get("status", "ACTIVE") == "ACTIVE":
+                columns[column["attributes"]["name"].lower()] = column
+        return columns
+
+    def _discover_purview_assets(self, name_filters: list[dict] = None):
+        """Yield Databricks table assets from the Data Map search API, one page at a time.
 
-    def _get_purview_uid(self, anomalo_tablename, purview_list):
-        for i in purview_list["value"]:
-            if i["name"] == anomalo_tablename:
-                return i["id"]
+        Args:
+            name_filters: optional qualifiedName attribute filters; assets matching any of them are returned
+        """
+        url = f"{self.purview_rooturl}/datamap/api/search/query?api-version=2023-09-01"
+        search_filter = {"entityType": "databricks_table"}
+        if name_filters:
+            search_filter = {"and": [search_filter, {"or": name_filters}]}
+
+        continuation_token = None
+        while True:
+            body = {"filter": search_filter, "limit": PURVIEW_SEARCH_PAGE_SIZE}
+            if continuation_token:
+                body["continuationToken"] = continuation_token
+            # a search query, so it is safe to retry
+            response = self.http.post(
+                url, data=json.dumps(body), headers=self.api_headers, idempotent=True
+            )
+            response.raise_for_status()
+            page = response.json()
+
+            yield from page.get("value", [])
+
+            continuation_token = page.get("continuationToken")
+            if not continuation_token or not page.get("value"):
+                return
+
+    @staticmethod
+    def _index_keys(asset: dict) -> list[str]:
+        """Lookup keys for an asset: `catalog.schema.table` and `schema.table` from its qualified name, then its bare name"""
+        keys = []
+        match = DATABRICKS_QUALIFIED_NAME.search(asset.get("qualifiedName") or "")
+        if match:
+            keys.append(
+                f"{match['catalog']}.{match['schema']}.{match['table']}".lower()
+            )
+            keys.append(f"{match['schema']}.{match['table']}".lower())
+        if asset.get("name"):
+            keys.append(asset["name"].lower())
+        return keys
+
+    def _index_asset(self, asset: dict):
+        """Add an asset to the lookup index; keys shared by several assets map to AMBIGUOUS_ASSET"""
+        for key in self._index_keys(asset):
+            if self.asset_index.get(key, asset["id"]) != asset["id"]:
+                self.asset_index[key] = AMBIGUOUS_ASSET
+            else:
+                self.asset_index[key] = asset["id"]
+
+    @staticmethod
+    def _get_catalog_name(warehouse) -> str:
+        """Databricks catalog name from the data source naming convention `NICKNAME-CATALOG` or `NICKNAME_CATALOG`"""
+        if warehouse.get("warehouse_type") != "databricks":
+            return None
+        for separator in ("-", "_"):
+            if separator in warehouse["name"]:
+                return warehouse["name"].split(separator, 1)[1]
+        return None
+
+    def _get_purview_uid(self, warehouse, table_full_name: str) -> str:
+        """Find the Purview asset id for an Anomalo table, most specific name first"""
+        schema_table = table_full_name.lower()
+        keys = [schema_table, schema_table.split(".")[-1]]
+        catalog = self._get_catalog_name(warehouse)
+        if catalog:
+            keys.insert(0, f"{catalog}.{schema_table}".lower())
+
+        for key in keys:
+            p_uid = self.asset_index.get(key)
+            if p_uid is AMBIGUOUS_ASSET:
+                print(f"WARNING several Purview assets match `{key}`")
+                continue
+            if p_uid:
+                return p_uid
         return None
 
     def _update_purview(self, uid: str, summary: AnomaloTableSummary):
@@ -105,7 +352,7 @@ class purview(AnomaloCatalogAdapter):
             labelurl = (
                 f"{self.purview_rooturl}/catalog/api/atlas/v2/entity/guid/{uid}/labels"
             )
-            response = requests.put(
+            response = self.http.put(
                 labelurl, data=labelpayload, headers=self.api_headers
             )
 
@@ -114,7 +361,7 @@ class purview(AnomaloCatalogAdapter):
             del_labels = summary.get_tags_to_remove()
             if del_labels:
                 dellabelpayload = json.dumps(del_labels)
-                response = requests.delete(
+                response = self.http.delete(
                     labelurl, data=dellabelpayload, headers=self.api_headers
                 )
 
@@ -134,31 +381,170 @@ class purview(AnomaloCatalogAdapter):
                         "entityGuids": [uid],
                     }
                 )
-                response = requests.post(url, data=body, headers=self.api_headers)
+                response = self.http.post(url, data=body, headers=self.api_headers)
             else:
                 # Remove certification if one or more checks failed
                 url = f"{self.purview_rooturl}/catalog/api/atlas/v2/entity/guid/{uid}/classification/MICROSOFT.POWERBI.ENDORSEMENT"
-                response = requests.delete(url, headers=self.api_headers)
+                response = self.http.delete(url, headers=self.api_headers)
 
         if self._args.update_aspect:
             # Write summary table to our metadata section
             url = f"{self.purview_rooturl}/catalog/api/atlas/v2/entity/guid/{uid}/businessmetadata"
-            _profile_html = None
-            if summary.table_profile_img:
-                _profile_html = f"<img src='{summary.table_profile_img}' alt='Table column data visualization' width='auto' height='auto' />"
-            _columns_html = None
-            if summary.table_columns_img:
-                _columns_html = f"<img src='{summary.table_columns_img}' alt='Table column data visualization' width='auto' height='auto' />"
-            body = json.dumps(
-                {
-                    "AnomaloDQ": {
-                        "AnomaloChecks": summary.get_status_text("purview"),
-                        "AnomaloColumns": _columns_html,
-                        "AnomaloProfile": _profile_html,
+            body = json.dumps(self._get_business_metadata(summary))
+            response = self.http.post(url, data=body, headers=self.api_headers)
+
+    def _get_business_metadata(self, summary: AnomaloTableSummary) -> dict:
+        _profile_html = None
+        if summary.table_profile_img:
+            _profile_html = f"<img src='{summary.table_profile_img}' alt='Table column data visualization' width='auto' height='auto' />"
+        _columns_html = None
+        if summary.table_columns_img:
+            _columns_html = f"<img src='{summary.table_columns_img}' alt='Table column data visualization' width='auto' height='auto' />"
+        return {
+            "AnomaloDQ": {
+                "AnomaloChecks": summary.get_status_text("purview"),
+                "AnomaloColumns": _columns_html,
+                "AnomaloProfile": _profile_html,
+            }
+        }
+
+    def _apply_batch(self, batch: list[tuple[int, tuple[str, AnomaloTableSummary]]]) -> dict:
+        """Publish DQ results for a batch of assets with bulk Atlas entity and classification calls.
+
+        Labels and business metadata for the whole batch are written with one bulk entity update,
+        and all newly certified assets are endorsed with one bulk classification call. If a bulk
+        call fails, the batch is retried one asset at a time so each table's failure is reported.
+        """
+        print(f"Publishing DQ results for {len(batch)} Purview assets...")
+        try:
+            return self._apply_bulk_updates(batch)
+        except Exception as e:
+            print(
+                f"WARNING bulk update of {len(batch)} Purview assets failed, retrying assets individually: {e}"
+            )
+
+        results = {}
+        for table_id, (uid, summary) in batch:
+            try:
+                self._update_purview(uid, summary)
+                results[table_id] = True
+            except Exception as e:
+                print(f"ERROR updating Purview asset {uid}: {e}")
+                results[table_id] = False
+        return results
+
+    def _apply_bulk_updates(self, batch: list[tuple[int, tuple[str, AnomaloTableSummary]]]) -> dict:
+        bulk_url = f"{self.purview_rooturl}/datamap/api/atlas/v2/entity/bulk"
+        entities = self._get_entities([uid for _, (uid, _) in batch])
+
+        results = {}
+        updates = []
+        certify = []
+        uncertify = []
+        for table_id, (uid, summary) in batch:
+            entity = entities.get(uid)
+            if not entity:
+                print(f"WARNING Purview asset {uid} no longer exists")
+                results[table_id] = False
+                continue
+            results[table_id] = True
+
+            labels = set(entity.get("labels") or [])
+            if self._args.update_labels:
+                labels -= set(summary.get_tags_to_remove())
+                labels |= set(summary.get_tags_to_apply() or ["ANOMALO_MONITORED"])
+            update = {
+                "typeName": entity["typeName"],
+                "guid": uid,
+                "attributes": {
+                    "qualifiedName": entity["attributes"]["qualifiedName"],
+                    "name": entity["attributes"].get("name"),
+                },
+                "labels": sorted(labels),
+            }
+            if self._args.update_aspect:
+                update["businessAttributes"] = self._get_business_metadata(summary)
+            updates.append(update)
+
+            if self._args.update_endorsement:
+                endorsed = any(
+                    c.get("typeName") == ENDORSEMENT_CLASSIFICATION
+                    for c in entity.get("classifications") or []
+                )
+                if summary.table_passed and not endorsed:
+                    certify.append(uid)
+                elif not summary.table_passed and endorsed:
+                    uncertify.append(uid)
+
+        if updates and (self._args.update_labels or self._args.update_aspect):
+            response = self.http.post(
+                bulk_url,
+                params={
+                    "api-version": DATAMAP_API_VERSION,
+                    "businessAttributeUpdateBehavior": "merge",
+                },
+                data=json.dumps({"entities": updates}),
+                headers=self.api_headers,
+            )
+            response.raise_for_status()
+
+        if certify:
+            # Certify assets that passed all checks
+            response = self.http.post(
+                f"{bulk_url}/classification",
+                params={"api-version": DATAMAP_API_VERSION},
+                data=json.dumps(
+                    {
+                        "classification": {
+                            "typeName": ENDORSEMENT_CLASSIFICATION,
+                            "attributes": {
+                                "endorsement": "Certified",
+                                "certifiedBy": "Anomalo",
+                            },
+                        },
+                        "entityGuids": certify,
                     }
-                }
+                ),
+                headers=self.api_headers,
+            )
+            response.raise_for_status()
+
+        # Classifications can only be removed one entity at a time, so only remove them where present
+        for uid in uncertify:
+            response = self.http.delete(
+                f"{self.purview_rooturl}/datamap/api/atlas/v2/entity/guid/{uid}/classification/{ENDORSEMENT_CLASSIFICATION}",
+                params={"api-version": DATAMAP_API_VERSION},
+                headers=self.api_headers,
+            )
+            if not response.ok:
+                print(
+                    f"ERROR removing endorsement from Purview asset {uid}: {response.status_code} {response.text}"
+                )
+                results.update(
+                    {table_id: False for table_id, (u, _) in batch if u == uid}
+                )
+
+        return results
+
+    def _get_entities(self, uids: list[str]) -> dict:
+        """Read entities by GUID with bulk entity reads of up to PURVIEW_BULK_READ_SIZE; missing GUIDs are left out"""
+        entities = {}
+        for chunk in self._chunks(list(dict.fromkeys(uids)), PURVIEW_BULK_READ_SIZE):
+            response = self.http.get(
+                f"{self.purview_rooturl}/datamap/api/atlas/v2/entity/bulk",
+                params={
+                    "guid": chunk,
+                    "ignoreRelationships": "true",
+                    "minExtInfo": "true",
+                    "api-version": DATAMAP_API_VERSION,
+                },
+                headers=self.api_headers,
+            )
+            response.raise_for_status()
+            entities.update(
+                (e["guid"], e) for e in response.json().get("entities", [])
             )
-            response = requests.post(url, data=body, headers=self.api_headers)
+        return entities
 
     # API endpoints
     # listguid = f"{self.purview_rooturl}/catalog/api/atlas/v2/entity/bulk?guid=65646cd5-57fd-4238-82e1-d9f6f6f60000"
@@ -238,7 +624,7 @@ class purview(AnomaloCatalogAdapter):
                 ]
             }
         )
-        response = requests.post(url, data=body, headers=self.api_headers).json()
+        response = self.http.post(url, data=body, headers=self.api_headers).json()
         if (
             response.get("errorMessage")
             and "already exists" not in response["errorMessage"]
@@ -250,6 +636,6 @@ class purview(AnomaloCatalogAdapter):
             and response.get("errorMessage")
             and "already exists" in response["errorMessage"]
         ):
-            response = requests.put(url, data=body, headers=self.api_headers).json()
+            response = self.http.put(url, data=body, headers=self.api_headers).json()
             print(f"Result from force-update of typedef: {response}")
         return True
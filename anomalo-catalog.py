@@ -13,13 +13,21 @@ try:
     except NameError:
         sys.path.insert(0, os.getcwd())
 
-    from anomalo_api import AnomaloClient
+    from anomalo_api import AnomaloClient, history_window_start
+    from sync_state import DEFAULT_SYNC_STATE_FILE, SyncStateStore
 except Exception as x:
     raise Exception(
         "Please install required packages with `pip install -r requirements.txt`"
     ) from x
 
+import hashlib
+import queue
+import threading
 import traceback
+from contextlib import contextmanager
+from datetime import date, timedelta
+from functools import partial
+from io import StringIO
 from typing import Sequence
 
 from adapters.base_adapter import AnomaloCatalogAdapter
@@ -27,6 +35,61 @@ from adapters.base_adapter import AnomaloCatalogAdapter
 
 AVAILABLE_ADAPTERS = {a.__name__: a for a in AnomaloCatalogAdapter.adapters()}
 
+# Outcome of syncing one table
+TABLE_UPDATED = "updated"
+TABLE_FAILED = "failed"
+TABLE_QUEUED = "queued"
+TABLE_UNCHANGED = "unchanged"
+
+
+class ThreadBufferedOutput:
+    """stdout replacement that collects output written by worker threads into a per-thread buffer.
+
+    Output from threads that are not capturing is passed straight through to the wrapped stream.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def write(self, message):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            return self._stream.write(message)
+        return buffer.write(message)
+
+    def flush(self):
+        if getattr(self._local, "buffer", None) is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    @contextmanager
+    def capture(self):
+        """Buffer everything the current thread prints until the block exits"""
+        self._local.buffer = StringIO()
+        try:
+            yield self._local.buffer
+        finally:
+            self._local.buffer = None
+
+
+def positive_int(value: str) -> int:
+    """argparse type for counts that must be at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def non_negative_int(value: str) -> int:
+    """argparse type for counts where 0 disables the option"""
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {value}")
+    return number
+
 
 def get_arg_parser():
     parser = argparse.ArgumentParser(
@@ -97,6 +160,12 @@ def get_arg_parser():
         dest="update_endorsement",
         help="Disable applying endorsement to monitored assets in the catalog (default: enabled)",
     )
+    parser.add_argument(
+        "--no-prefetch",  # Inverse name for disabling the flag
+        action="store_false",
+        dest="prefetch_catalog_state",
+        help="Disable bulk-reading existing catalog metadata for each data source before syncing its tables (default: enabled)",
+    )
     parser.add_argument(
         "--force-update-typedefs",
         action="store_true",
@@ -110,9 +179,317 @@ def get_arg_parser():
         help="Overwrite existing table comments entirely instead of only updating the Anomalo section (default: disabled)",
     )
 
+    parser.add_argument(
+        "--sync-checks",
+        action="store_true",
+        dest="sync_checks",
+        help="Also publish the status of each individual check, for catalogs that support it (default: disabled)",
+    )
+    parser.add_argument(
+        "--sync-columns",
+        action="store_true",
+        dest="sync_columns",
+        help="Also publish the DQ status of each column that has checks, for catalogs that support it (default: disabled)",
+    )
+
+    parser.add_argument(
+        "--export-file",
+        type=str,
+        default=None,
+        dest="export_file",
+        help="File to write with --catalog export (default: anomalo-dq-export-<timestamp>.<format>)",
+    )
+    parser.add_argument(
+        "--export-format",
+        type=str,
+        choices=["jsonl", "parquet"],
+        default="jsonl",
+        dest="export_format",
+        help="File format for --catalog export; parquet requires pyarrow (default: jsonl)",
+    )
+    parser.add_argument(
+        "--export-compression",
+        type=str,
+        choices=["none", "gzip", "snappy", "zstd"],
+        default=None,
+        dest="export_compression",
+        help="Compression for --catalog export; jsonl supports gzip (default: none for jsonl, snappy for parquet)",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=positive_int,
+        default=1,
+        dest="workers",
+        help="Number of tables to publish to the catalog concurrently (default: 1, sync one table at a time)",
+    )
+    parser.add_argument(
+        "--fetch-workers",
+        type=positive_int,
+        default=None,
+        dest="fetch_workers",
+        help="Number of tables to fetch from Anomalo concurrently (default: same as --workers)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=positive_int,
+        default=None,
+        dest="queue_size",
+        help="Number of fetched tables that can wait to be published (default: twice the larger number of workers)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=non_negative_int,
+        default=0,
+        dest="batch_size",
+        help="Queue catalog updates and submit them in batches of this many tables, for catalogs that support it (default: 0, no batching)",
+    )
+
+    parser.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        dest="skip_unchanged",
+        help="Skip catalog writes for tables whose DQ status has not changed since they were last synced (default: disabled)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        dest="incremental",
+        help="Skip tables with no new Anomalo check run since they were last synced (default: disabled)",
+    )
+    parser.add_argument(
+        "--history-days",
+        type=non_negative_int,
+        default=0,
+        dest="history_days",
+        help="Also publish how many of the last N days each table's checks failed, e.g. 'Failed 3 of last 7 days'; check run aggregates are cached in the state file (default: 0, latest check run only)",
+    )
+    parser.add_argument(
+        "--state-file",
+        type=str,
+        default=DEFAULT_SYNC_STATE_FILE,
+        dest="state_file",
+        help=f"Local file recording what was last synced for each table (default: {DEFAULT_SYNC_STATE_FILE})",
+    )
+
     return parser
 
 
+def fetch_table(
+    client,
+    warehouse,
+    table,
+    sync_state=None,
+    digest_options=(),
+    incremental=False,
+    with_checks=False,
+    with_columns=False,
+    history_days=0,
+    history_store=None,
+):
+    """Fetch the DQ summary for a configured table.
+
+    Returns `(table_id, table_summary, state)` where state holds the fields to record in the
+    sync state store once the table is updated. table_summary is None if the table is
+    unchanged since it was last synced; state then holds its latest job to record. With `with_checks` and `with_columns`, the summary
+    also holds a record of each check for `--sync-checks` and the status of each column for `--sync-columns`.
+    With `history_days`, the summary's history covers that many days, cached in `history_store`,
+    unless the table's check intervals have no recognizable dates.
+    """
+    table_id = table["table"]["id"]
+    options_digest = hashlib.sha256(repr(digest_options).encode("utf-8")).hexdigest()
+    previous = sync_state.get(warehouse["id"], table_id) if sync_state else None
+
+    job_id = None
+    history_jobs = None
+    if history_days:
+        history_jobs = client.get_history_jobs(table_id, history_days, history_store)
+    if history_jobs is not None:
+        # the same as `get_latest_job_id()`: the newest job as of yesterday
+        since = (date.today() - timedelta(1)).strftime("%Y-%m-%d")
+        job_id = next((job for day, job, _ in history_jobs if day >= since), None)
+    if incremental:
+        if history_jobs is None:
+            job_id = client.get_latest_job_id(table_id)
+        if (
+            previous
+            and job_id is not None
+            and previous["job_id"] == job_id
+            and previous["options_digest"] == options_digest
+        ):
+            print(
+                f"  No new check runs since last sync: {table['table']['full_name']} ({table_id})"
+            )
+            return table_id, None, _unchanged_state(previous, job_id)
+
+    table_summary = client.get_table_summary(
+        table, job_id=job_id, with_checks=with_checks, with_columns=with_columns
+    )
+    if history_jobs is not None:
+        table_summary.history = client.get_check_history(
+            table_id,
+            history_jobs,
+            history_days,
+            history_store=history_store,
+            latest_summary=table_summary,
+        )
+    if previous:
+        table_summary.catalog_asset_id = previous["catalog_asset_id"]
+    digest = table_summary.get_digest(*digest_options)
+    if previous and previous["digest"] == digest:
+        print(
+            f"  Unchanged since last sync: {table_summary.table_full_name} ({table_summary.table_id})"
+        )
+        # record the new job, so that `--incremental` does not fetch the table again until its next run
+        return table_id, None, _unchanged_state(previous, table_summary.job_id)
+
+    state = {
+        "digest": digest,
+        "job_id": table_summary.job_id,
+        "options_digest": options_digest,
+    }
+    return table_id, table_summary, state
+
+
+def _unchanged_state(previous: dict, job_id) -> dict:
+    """State to record for a table whose published DQ status has not changed"""
+    return {
+        "digest": previous["digest"],
+        "job_id": job_id,
+        "options_digest": previous["options_digest"],
+    }
+
+
+def publish_table(adapter, warehouse, fetched):
+    """Publish a table fetched by `fetch_table()` to the catalog.
+
+    Returns `(table_id, outcome, state)` where outcome is one of the TABLE_* values.
+    """
+    table_id, table_summary, state = fetched
+    if table_summary is None:
+        return table_id, TABLE_UNCHANGED, state
+
+    try:
+        updated = adapter.update_catalog_asset(warehouse, table_summary)
+        for update_details, details in (
+            (adapter.update_catalog_checks, table_summary.check_records),
+            (adapter.update_catalog_columns, table_summary.column_statuses),
+        ):
+            if updated is False or details is None:
+                continue
+            details_updated = update_details(warehouse, table_summary, details)
+            # the table is queued (None) if any of its updates was queued
+            if details_updated is False:
+                updated = False
+            elif updated is not None:
+                updated = details_updated
+    except Exception as e:
+        print(traceback.format_exc())
+        updated = False
+
+    state = dict(state, catalog_asset_id=table_summary.catalog_asset_id)
+    if updated is None:
+        return table_id, TABLE_QUEUED, state
+    return table_id, TABLE_UPDATED if updated else TABLE_FAILED, state
+
+
+def sync_tables_pipelined(
+    fetch, publish, tables, fetch_workers: int, publish_workers: int, queue_size: int
+):
+    """Fetch and publish tables in two concurrent stages; yields each table's result as it completes.
+
+    `fetch_workers` threads call `fetch(table)` and hand the results to `publish_workers` threads
+    calling `publish(fetched)` through a queue holding at most `queue_size` tables, so fetching
+    waits when publishing falls behind. Each table's log output is buffered and printed as one
+    block when the table finishes.
+    """
+    output = sys.stdout
+    if not isinstance(output, ThreadBufferedOutput):
+        output = ThreadBufferedOutput(sys.stdout)
+
+    tables = iter(tables)
+    tables_lock = threading.Lock()
+    fetched_tables = queue.Queue(maxsize=queue_size)
+    results = queue.Queue()
+    stop = threading.Event()
+    finished = object()
+
+    def next_table():
+        with tables_lock:
+            return next(tables, None)
+
+    def produce():
+        while not stop.is_set():
+            table = next_table()
+            if table is None:
+                return
+            with output.capture() as log:
+                try:
+                    fetched, error = fetch(table), None
+                except Exception as e:
+                    fetched, error = None, e
+            if error:
+                results.put((None, log.getvalue(), error))
+                continue
+            if fetched[1] is None:
+                # unchanged, nothing to publish
+                results.put((publish(fetched), log.getvalue(), None))
+                continue
+            while not stop.is_set():
+                try:
+                    fetched_tables.put((fetched, log.getvalue()), timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def consume():
+        while True:
+            item = fetched_tables.get()
+            if item is None:
+                return
+            fetched, fetch_log = item
+            if stop.is_set():
+                continue
+            with output.capture() as log:
+                try:
+                    result, error = publish(fetched), None
+                except Exception as e:
+                    result, error = None, e
+            results.put((result, fetch_log + log.getvalue(), error))
+
+    def run():
+        producers = [threading.Thread(target=produce) for _ in range(fetch_workers)]
+        consumers = [threading.Thread(target=consume) for _ in range(publish_workers)]
+        for t in producers + consumers:
+            t.start()
+        for t in producers:
+            t.join()
+        for _ in consumers:
+            fetched_tables.put(None)
+        for t in consumers:
+            t.join()
+        results.put(finished)
+
+    original_stdout = sys.stdout
+    sys.stdout = output
+    coordinator = threading.Thread(target=run)
+    coordinator.start()
+    try:
+        while True:
+            item = results.get()
+            if item is finished:
+                return
+            result, log, error = item
+            print(log, end="")
+            if error:
+                raise error
+            yield result
+    finally:
+        stop.set()
+        coordinator.join()
+        sys.stdout = original_stdout
+
+
 def main(cli_args: Sequence[str] = None):
     args = get_arg_parser().parse_args(cli_args)
 
@@ -135,48 +512,133 @@ def main(cli_args: Sequence[str] = None):
         exit(3)
 
     adapter = AVAILABLE_ADAPTERS[args.catalog](args)
-    adapter.configure()
-
-    print(
-        f"Reading warehouse list from Anomalo deployment HOST={client.api_client.host} ORGANIZATION_ID={client.organization_id} ..."
-    )
-    warehouses = client.get_warehouses()["warehouses"]
-    wh_summary = [wh["name"] + " (" + str(wh["id"]) + ")" for wh in warehouses]
-    print(f"Found {len(warehouses)} data sources: {wh_summary}")
-
-    updated_table_count = 0
-    error_table_count = 0
-    for wh in warehouses:
-        if args.warehouse_name and wh["name"] != args.warehouse_name:
-            print(f"Skipping `{wh['name']}` ({wh['id']}): name filter")
-            continue
-        if args.warehouse_id and wh["id"] != args.warehouse_id:
-            print(f"Skipping `{wh['name']}` ({wh['id']}): id filter")
-            continue
-        if not adapter.include_warehouse(wh):
-            print(f"Skipping unsupported data source `{wh['name']}` ({wh['id']})...")
-            continue
+    state_store = None
+    counts = {TABLE_UPDATED: 0, TABLE_FAILED: 0, TABLE_UNCHANGED: 0}
+    completed = False
+    try:
+        adapter.configure()
 
         print(
-            f"Processing configured tables in data source `{wh['name']}` ({wh['id']})..."
+            f"Reading warehouse list from Anomalo deployment HOST={client.api_client.host} ORGANIZATION_ID={client.organization_id} ..."
         )
-        configured_tables = client.get_configured_tables(warehouse_id=wh["id"])
-        print(
-            f"Publishing DQ status to {len(configured_tables)} configured tables in data source `{wh['name']}` ({wh['id']})..."
+        warehouses = client.get_warehouses()["warehouses"]
+        wh_summary = [wh["name"] + " (" + str(wh["id"]) + ")" for wh in warehouses]
+        print(f"Found {len(warehouses)} data sources: {wh_summary}")
+
+        if args.skip_unchanged or args.incremental or args.history_days:
+            state_store = SyncStateStore(
+                args.state_file, args.catalog, client.organization_id
+            )
+            print(f"Using sync state from `{state_store.path}`")
+        # --history-days only uses the state file to cache check run aggregates
+        sync_state = state_store if args.skip_unchanged or args.incremental else None
+        adapter.sync_state = sync_state
+        history_store = None
+        if args.history_days:
+            history_store = state_store
+            history_store.prune_history(history_window_start(args.history_days))
+        digest_options = (
+            args.catalog,
+            args.update_table_description,
+            args.update_labels,
+            args.update_aspect,
+            args.update_endorsement,
+            args.overwrite_table_comment,
+            args.sync_checks,
+            args.sync_columns,
+            args.history_days,
         )
-        for t in configured_tables:
-            table_summary = client.get_table_summary(t)
-            try:
-                if adapter.update_catalog_asset(wh, table_summary):
-                    updated_table_count += 1
-                else:
-                    error_table_count += 1
-            except Exception as e:
-                print(traceback.format_exc())
-                error_table_count += 1
 
+        sync_checks = args.sync_checks
+        if sync_checks and not adapter.supports_check_sync():
+            print(
+                f"WARNING {args.catalog} does not support --sync-checks, only table-level DQ status will be synced"
+            )
+            sync_checks = False
+        sync_columns = args.sync_columns
+        if sync_columns and not adapter.supports_column_sync():
+            print(
+                f"WARNING {args.catalog} does not support --sync-columns, column DQ status will not be synced"
+            )
+            sync_columns = False
+
+        fetch_workers = args.fetch_workers or args.workers
+        queue_size = args.queue_size or 2 * max(fetch_workers, args.workers)
+
+        for wh in warehouses:
+            if args.warehouse_name and wh["name"] != args.warehouse_name:
+                print(f"Skipping `{wh['name']}` ({wh['id']}): name filter")
+                continue
+            if args.warehouse_id and wh["id"] != args.warehouse_id:
+                print(f"Skipping `{wh['name']}` ({wh['id']}): id filter")
+                continue
+            if not adapter.include_warehouse(wh):
+                print(f"Skipping unsupported data source `{wh['name']}` ({wh['id']})...")
+                continue
+
+            print(
+                f"Processing configured tables in data source `{wh['name']}` ({wh['id']})..."
+            )
+            configured_tables = client.get_configured_tables(warehouse_id=wh["id"])
+            adapter.prepare_warehouse(wh, configured_tables)
+            print(
+                f"Publishing DQ status to {len(configured_tables)} configured tables in data source `{wh['name']}` ({wh['id']})..."
+            )
+            fetch = partial(
+                fetch_table,
+                client,
+                wh,
+                sync_state=sync_state,
+                digest_options=digest_options,
+                incremental=args.incremental,
+                with_checks=sync_checks,
+                with_columns=sync_columns,
+                history_days=args.history_days,
+                history_store=history_store,
+            )
+            publish = partial(publish_table, adapter, wh)
+            if args.workers > 1 or fetch_workers > 1:
+                results = sync_tables_pipelined(
+                    fetch,
+                    publish,
+                    configured_tables,
+                    fetch_workers,
+                    args.workers,
+                    queue_size,
+                )
+            else:
+                results = (publish(fetch(t)) for t in configured_tables)
+
+            queued_states = {}
+            for table_id, outcome, state in results:
+                if outcome == TABLE_QUEUED:
+                    queued_states[table_id] = state
+                    continue
+                counts[outcome] += 1
+                if outcome in (TABLE_UPDATED, TABLE_UNCHANGED) and sync_state:
+                    sync_state.record(wh["id"], table_id, **state)
+
+            for table_id, updated in adapter.flush_catalog_updates(wh).items():
+                if table_id not in queued_states:
+                    # already counted, e.g. its check updates failed after its table update was queued
+                    continue
+                counts[TABLE_UPDATED if updated else TABLE_FAILED] += 1
+                if updated and sync_state:
+                    sync_state.record(wh["id"], table_id, **queued_states[table_id])
+
+            if state_store:
+                state_store.commit()
+        completed = True
+    finally:
+        adapter.close(completed)
+        if state_store:
+            state_store.close()
+
+    unchanged = (
+        f" Skipped {counts[TABLE_UNCHANGED]} unchanged tables." if sync_state else ""
+    )
     print(
-        f"\n\nFINISHED SYNC. Updated {updated_table_count} tables, failed to sync {error_table_count} tables.\n"
+        f"\n\nFINISHED SYNC. Updated {counts[TABLE_UPDATED]} tables, failed to sync {counts[TABLE_FAILED]} tables.{unchanged}\n"
     )
 
 
@@ -1,7 +1,49 @@
+import hashlib
+import json
+from array import array
 from datetime import date, timedelta
 
 import anomalo
-
+from status_text import render_column_status_text, render_status_text
+
+
+# Check groups: table observability checks, and data quality checks that are only meaningful if those pass
+TO_CHECKS = "to"
+DQ_CHECKS = "dq"
+
+# Categories that check results are summarized in, in display order
+CHECK_CATEGORIES = (
+    ("data_freshness", "Data Freshness", TO_CHECKS),
+    ("data_volume", "Data Volume", TO_CHECKS),
+    ("missing_data", "Missing Data", DQ_CHECKS),
+    ("anomaly", "Table Anomalies", DQ_CHECKS),
+    ("metric", "Key Metrics", DQ_CHECKS),
+    ("rule", "Validation Rules", DQ_CHECKS),
+    # check types missing from CHECK_TYPE_REGISTRY; only shown if a table has any
+    ("other", "Other Checks", DQ_CHECKS),
+)
+CHECK_CATEGORY_INDEX = {name: i for i, (name, _, _) in enumerate(CHECK_CATEGORIES)}
+OTHER_CHECK_CATEGORY = "other"
+
+# Anomalo check type -> summary category
+CHECK_TYPE_REGISTRY = {
+    "data_freshness": "data_freshness",
+    "data_volume": "data_volume",
+    "missing_data": "missing_data",
+    "anomaly": "anomaly",
+    "metric": "metric",
+    "rule": "rule",
+}
+
+# Offsets of each category's counters in a check counter array, see `aggregate_check_runs()`
+COUNT_TOTAL, COUNT_PASS, COUNT_FAIL, COUNT_ERRORED, COUNT_SKIPPED = range(5)
+COUNTERS_PER_CATEGORY = 5
+
+# Status of a single check run, see `AnomaloCheckRecord`
+CHECK_PASSED = "passed"
+CHECK_FAILED = "failed"
+CHECK_ERRORED = "errored"
+CHECK_SKIPPED = "skipped"
 
 ANOMALO_ASSET_TAGS = [
     "ANOMALO_MONITORED",
@@ -28,6 +70,8 @@ class AnomaloClient:
                 "Anomalo API is not reachable. Please check your configuration."
             )
         self.organization_id = self.api_client.get_active_organization_id()
+        # the same for every table, so built once rather than per table summary
+        self.table_url_prefix = f"{self.api_client.proto}://{self.api_client.host}/dashboard/orgs/{self.organization_id}/tables/"
 
     def get_warehouses(self):
         """Get a list of the configured warehouses in the current Anomalo organization."""
@@ -38,12 +82,191 @@ class AnomaloClient:
         config_tables = self.api_client.configured_tables(warehouse_id=warehouse_id)
         return config_tables
 
-    def get_table_summary(self, table, warehouse_id=None):
-        """Get an AnomaloTableSummary containing statistics and status for a table."""
-        return AnomaloTableSummary(self.api_client, table, warehouse_id=warehouse_id)
+    def get_latest_job_id(self, table_id):
+        """Get the id of the most recent (as of yesterday) check run job for a table, or None if there is none."""
+        job_date = (date.today() - timedelta(1)).strftime("%Y-%m-%d")
+        res = self.api_client.get_check_intervals(
+            table_id=table_id, start=job_date, end=None
+        )
+        if res and len(res):
+            return res[0]["latest_run_checks_job_id"]
+        return None
+
+    def get_history_jobs(self, table_id, history_days, history_store=None) -> list:
+        """Get the latest check run job of each of the last `history_days` days for a table, newest first.
+
+        Returns `(day, job_id, cached)` for each day with a check run, where cached holds the day's
+        aggregates from `history_store` if they were recorded for the same job. Check intervals are
+        read with one call, starting from the most recent day already in `history_store`, so
+        syncing daily only reads the newest intervals. Returns None, with a warning, if the
+        intervals have no recognizable date, rather than reporting days without check runs.
+        """
+        window_start = history_window_start(history_days)
+        cached = history_store.get_history(table_id, window_start) if history_store else {}
+        res = self.api_client.get_check_intervals(
+            table_id=table_id, start=max([window_start, *cached]), end=None
+        )
+        jobs = {day: row["job_id"] for day, row in cached.items()}
+        fetched_days = set()
+        undated = []
+        # intervals are newest first, so the first interval of a day has its latest job
+        for interval in res or []:
+            job_id = interval.get("latest_run_checks_job_id")
+            if job_id is None:
+                continue
+            day = _interval_day(interval)
+            if day is None:
+                undated.append(interval)
+                continue
+            if day < window_start:
+                # the API may return intervals from before `start`
+                continue
+            if day not in fetched_days:
+                fetched_days.add(day)
+                jobs[day] = job_id
+        if undated:
+            print(
+                f"WARNING {len(undated)} check intervals of table {table_id} have no recognizable start date"
+                f" (fields: {', '.join(sorted(undated[0]))}), not publishing its check history"
+            )
+            return None
+        return [
+            (
+                day,
+                job_id,
+                cached[day] if cached.get(day, {}).get("job_id") == job_id else None,
+            )
+            for day, job_id in sorted(jobs.items(), reverse=True)
+        ]
+
+    def get_check_history(
+        self, table_id, history_jobs, history_days, history_store=None, latest_summary=None
+    ):
+        """Get the AnomaloCheckHistory of a table from its `get_history_jobs()`.
+
+        Only jobs without cached aggregates have their results fetched; `latest_summary`'s job is
+        aggregated from the summary. New aggregates are recorded in `history_store`.
+        """
+        days = []
+        for day, job_id, cached in history_jobs:
+            if cached:
+                days.append(
+                    (day, job_id, cached["checks_total"], cached["checks_failed"])
+                )
+                continue
+            if latest_summary is not None and job_id == latest_summary.job_id:
+                checks_total = latest_summary.checks_total
+                checks_failed = latest_summary.checks_failed
+            else:
+                counts, _, _ = aggregate_check_runs(
+                    self.api_client.get_run_result(job_id=job_id).get("check_runs", [])
+                )
+                checks_total = sum(counts[COUNT_TOTAL::COUNTERS_PER_CATEGORY])
+                checks_failed = sum(counts[COUNT_FAIL::COUNTERS_PER_CATEGORY])
+            days.append((day, job_id, checks_total, checks_failed))
+            if history_store:
+                history_store.record_history(
+                    table_id, day, job_id, checks_total, checks_failed
+                )
+        return AnomaloCheckHistory(history_days, days)
+
+    def get_table_profile_images(self, warehouse_id, table):
+        """Get the `(profile, columns)` image URLs of a table's profile; None for images that are unavailable."""
+        try:
+            profile_resp = self.api_client.get_table_profile(
+                warehouse_id=warehouse_id, table_id=table["table"]["id"]
+            )
+        except anomalo.result.BadRequestException as e:
+            full_name = table["table"]["full_name"]
+            print(f"WARNING cannot fetch table profile for {full_name}: {e}")
+            return None, None
+        return (
+            profile_resp.get("profile", {}).get("img_url"),
+            profile_resp.get("columns", {}).get("img_url"),
+        )
+
+    def get_run_result(self, table_id, job_id=None):
+        """Get the latest check run job id of a table and the results of that run.
+
+        Returns `(job_id, results)`, or `(None, {})` if the table has no recent check run.
+        Pass `job_id` if the latest check run job is already known to skip looking it up.
+        """
+        if job_id is None:
+            job_id = self.get_latest_job_id(table_id)
+        if job_id is None:
+            return None, {}
+        return job_id, self.api_client.get_run_result(job_id=job_id)
+
+    def get_table_summary(
+        self, table, warehouse_id=None, job_id=None, with_checks=False, with_columns=False
+    ):
+        """Get an AnomaloTableSummary containing statistics and status for a table.
+
+        Pass `job_id` if the latest check run job is already known to skip looking it up.
+        With `with_checks`, the summary's `check_records` hold the status of each check, see `iter_check_records()`.
+        With `with_columns`, the summary's `column_statuses` hold the status of each checked column, see `summarize_columns()`.
+        """
+        table_id = table["table"]["id"]
+        profile_images = None
+        if warehouse_id:
+            profile_images = self.get_table_profile_images(warehouse_id, table)
+        job_id, run_result = self.get_run_result(table_id, job_id=job_id)
+        return self._make_table_summary(
+            table,
+            job_id,
+            run_result,
+            profile_images,
+            with_checks=with_checks,
+            with_columns=with_columns,
+        )
+
+    def _make_table_summary(
+        self,
+        table,
+        job_id,
+        run_result,
+        profile_images=None,
+        with_checks=False,
+        with_columns=False,
+    ):
+        summary = AnomaloTableSummary(
+            self.api_client,
+            table,
+            job_id=job_id,
+            run_result=run_result,
+            table_url=f"{self.table_url_prefix}{table['table']['id']}",
+            profile_images=profile_images,
+        )
+        if with_checks or with_columns:
+            check_records = tuple(
+                iter_check_records(
+                    run_result.get("check_runs", []), summary.anomalo_table_url
+                )
+            )
+            if with_columns:
+                summary.column_statuses = summarize_columns(check_records)
+            if with_checks:
+                summary.check_records = check_records
+        return summary
+
+
+def history_window_start(history_days: int) -> str:
+    """First day (YYYY-MM-DD) of a history window of `history_days` days, ending today"""
+    return (date.today() - timedelta(history_days - 1)).strftime("%Y-%m-%d")
+
+
+def _interval_day(interval: dict) -> str:
+    """Day (YYYY-MM-DD) of a check interval returned by `get_check_intervals()`, or None if it has no ISO start date"""
+    start = interval.get("interval_start") or interval.get("start")
+    try:
+        return date.fromisoformat(str(start)[:10]).isoformat()
+    except ValueError:
+        return None
 
 
 class AnomaloCheckResult:
+    __slots__ = ("name", "total", "passed", "failed", "pending")
+
     def __init__(self, name, total, passed, failed, pending=False):
         self.name = name
         self.total = total
@@ -58,41 +281,341 @@ class AnomaloCheckResult:
         return f"{self.name}: {self.passed}/{self.total} passed {icon}"
 
 
+def _run_errored(results: dict) -> bool:
+    """Whether a check run without a pass/fail result failed to run, rather than being skipped"""
+    return bool(
+        results.get("error")
+        or results.get("exception")
+        or results.get("exception_msg")
+        or results.get("status") in ("error", "errored")
+    )
+
+
+def aggregate_check_runs(check_runs) -> tuple:
+    """Count the results of a check run job's `check_runs` per check category in a single pass.
+
+    Returns `(counts, to_checks_failed, dq_checks_failed)` where counts is an array holding
+    COUNTERS_PER_CATEGORY counters for each of the CHECK_CATEGORIES. Runs of unregistered
+    check types are counted in the "other" category. Runs with no pass/fail result are
+    counted as errored or skipped.
+    """
+    offsets = {
+        check_type: (
+            CHECK_CATEGORY_INDEX[category] * COUNTERS_PER_CATEGORY,
+            CHECK_CATEGORIES[CHECK_CATEGORY_INDEX[category]][2] == TO_CHECKS,
+        )
+        for check_type, category in CHECK_TYPE_REGISTRY.items()
+    }
+    other = (CHECK_CATEGORY_INDEX[OTHER_CHECK_CATEGORY] * COUNTERS_PER_CATEGORY, False)
+
+    counts = array("l", [0]) * (COUNTERS_PER_CATEGORY * len(CHECK_CATEGORIES))
+    to_checks_failed = dq_checks_failed = False
+    for r in check_runs:
+        offset, is_to_check = offsets.get(
+            r["run_config"]["_metadata"]["check_type"], other
+        )
+        counts[offset + COUNT_TOTAL] += 1
+        results = r.get("results") or {}
+        success = results.get("success")
+        if success is True:
+            counts[offset + COUNT_PASS] += 1
+        elif success is False:
+            counts[offset + COUNT_FAIL] += 1
+            if is_to_check:
+                to_checks_failed = True
+            else:
+                dq_checks_failed = True
+        elif _run_errored(results):
+            counts[offset + COUNT_ERRORED] += 1
+        else:
+            counts[offset + COUNT_SKIPPED] += 1
+    return counts, to_checks_failed, dq_checks_failed
+
+
+class AnomaloCheckRecord:
+    """Status of one check in a table's check run job, see `iter_check_records()`"""
+
+    __slots__ = (
+        "check_id",
+        "name",
+        "check_type",
+        "category",
+        "status",
+        "result",
+        "run_url",
+        "columns",
+    )
+
+    def __init__(
+        self, check_id, name, check_type, category, status, result, run_url, columns=()
+    ):
+        self.check_id = check_id
+        self.name = name
+        self.check_type = check_type
+        self.category = category
+        self.status = status
+        self.result = result
+        self.run_url = run_url
+        # names of the columns the check is configured on, if any
+        self.columns = columns
+
+    def as_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"{self.name}: {self.status}"
+
+
+def _check_status(results: dict) -> str:
+    """One of the CHECK_* statuses for a check run's results, counted the same way as `aggregate_check_runs()`"""
+    success = results.get("success")
+    if success is True:
+        return CHECK_PASSED
+    if success is False:
+        return CHECK_FAILED
+    return CHECK_ERRORED if _run_errored(results) else CHECK_SKIPPED
+
+
+def _check_columns(run_config: dict) -> tuple:
+    """Names of the columns a check is configured on, from its `run_config`"""
+    columns = run_config.get("column_name") or run_config.get("columns") or ()
+    if isinstance(columns, str):
+        return (columns,)
+    return tuple(c for c in columns if isinstance(c, str))
+
+
+def iter_check_records(check_runs: list, table_url: str):
+    """Yield an AnomaloCheckRecord for each of a check run job's `check_runs`; `check_runs` is not modified"""
+    category_names = {name: display_name for name, display_name, _ in CHECK_CATEGORIES}
+    for r in check_runs:
+        metadata = r["run_config"]["_metadata"]
+        check_type = metadata["check_type"]
+        # 0 is a valid static id
+        check_id = r.get("check_static_id")
+        if check_id is None:
+            check_id = r.get("check_id")
+        results = r.get("results") or {}
+        yield AnomaloCheckRecord(
+            check_id=check_id,
+            name=metadata.get("description")
+            or metadata.get("check_message")
+            or check_type,
+            check_type=check_type,
+            category=category_names[
+                CHECK_TYPE_REGISTRY.get(check_type, OTHER_CHECK_CATEGORY)
+            ],
+            status=_check_status(results),
+            result=results.get("evaluated_message")
+            or results.get("exception_msg")
+            or results.get("error")
+            or "",
+            run_url=f"{table_url}/checks/{check_id}",
+            columns=_check_columns(r["run_config"]),
+        )
+
+
+class AnomaloColumnStatus:
+    """DQ status of one column, from the checks configured on it; see `summarize_columns()`"""
+
+    __slots__ = ("column_name", "total", "passed", "failed", "failed_checks")
+
+    def __init__(self, column_name):
+        self.column_name = column_name
+        self.total = 0
+        self.passed = 0
+        self.failed = 0
+        self.failed_checks = []
+
+    @property
+    def status(self) -> str:
+        """CHECK_FAILED if any check failed, CHECK_PASSED if all passed, else CHECK_SKIPPED"""
+        if self.failed:
+            return CHECK_FAILED
+        return CHECK_PASSED if self.passed == self.total else CHECK_SKIPPED
+
+    @property
+    def shape(self) -> tuple:
+        return (self.total, self.passed, self.failed, tuple(self.failed_checks))
+
+    def get_status_text(self, dialect="plaintext") -> str:
+        """Short summary of the column's checks, in one of the status text dialects"""
+        return render_column_status_text(
+            self.total, self.passed, self.failed, self.failed_checks, dialect
+        )
+
+
+def summarize_columns(check_records) -> dict:
+    """Group check records by the columns they are configured on, in one pass.
+
+    Returns an AnomaloColumnStatus per column name; checks on several columns count towards each of them.
+    """
+    columns = {}
+    for record in check_records:
+        for column_name in record.columns:
+            column = columns.get(column_name)
+            if column is None:
+                column = columns[column_name] = AnomaloColumnStatus(column_name)
+            column.total += 1
+            if record.status == CHECK_PASSED:
+                column.passed += 1
+            elif record.status == CHECK_FAILED:
+                column.failed += 1
+                column.failed_checks.append(record.name)
+    return columns
+
+
+class AnomaloCheckHistory:
+    """Rolling DQ status of a table over its last `history_days` days, see `AnomaloClient.get_check_history()`.
+
+    A day failed if its latest check run job had any failed checks.
+    """
+
+    __slots__ = ("history_days", "days")
+
+    def __init__(self, history_days: int, days: list):
+        self.history_days = history_days
+        # (day, job_id, checks_total, checks_failed) of each day with a check run, newest first
+        self.days = days
+
+    @property
+    def days_with_runs(self) -> int:
+        return len(self.days)
+
+    @property
+    def days_failed(self) -> int:
+        return sum(1 for _, _, _, failed in self.days if failed)
+
+    @property
+    def pass_rate(self) -> float:
+        """Fraction of days with check runs on which no check failed, or None if there were no check runs"""
+        if not self.days:
+            return None
+        return (self.days_with_runs - self.days_failed) / self.days_with_runs
+
+    def _streak(self, failed: bool) -> int:
+        streak = 0
+        for _, _, _, checks_failed in self.days:
+            if bool(checks_failed) != failed:
+                break
+            streak += 1
+        return streak
+
+    @property
+    def failing_streak(self) -> int:
+        """Number of most recent days with check runs that failed in a row"""
+        return self._streak(True)
+
+    @property
+    def passing_streak(self) -> int:
+        """Number of most recent days with check runs that passed in a row"""
+        return self._streak(False)
+
+    @property
+    def shape(self) -> tuple:
+        return (self.history_days, tuple(tuple(d) for d in self.days))
+
+    def get_status_text(self) -> str:
+        """e.g. `Failed 3 of last 7 days, 2 days in a row`"""
+        if not self.days:
+            return f"No check runs in the last {self.history_days} days"
+        if not self.days_failed:
+            return f"Passed all {self.days_with_runs} days with check runs in the last {self.history_days} days"
+        text = f"Failed {self.days_failed} of last {self.history_days} days"
+        if self.failing_streak > 1:
+            text += f", {self.failing_streak} days in a row"
+        return text
+
+
+def _counter_property(category: str, counter: int) -> property:
+    """Attribute access to one of AnomaloTableSummary's check counters"""
+    offset = CHECK_CATEGORY_INDEX[category] * COUNTERS_PER_CATEGORY + counter
+
+    def get(self) -> int:
+        return self._counts[offset]
+
+    def set(self, value: int):
+        self._counts[offset] = value
+
+    return property(get, set)
+
+
 class AnomaloTableSummary:
-    def __init__(self, api_client, table, warehouse_id=None):
-        """Finds the most recent (as of yesterday) check job run for the table and computes DQ summary statistics for that job run"""
+    """DQ summary of a table's latest check run.
+
+    Only the table's id and name are kept from the configured table, and check counts are
+    stored in one counter array indexed by check category (see `aggregate_check_runs()`);
+    they are also available as `<category>_total`, `<category>_pass` and `<category>_fail` attributes.
+    `results`, `summaries` and status text are built when first used.
+    """
+
+    __slots__ = (
+        "api_client",
+        "catalog_asset_id",
+        "table_id",
+        "table_full_name",
+        "table_profile_img",
+        "table_columns_img",
+        "job_id",
+        "anomalo_table_url",
+        "to_checks_failed",
+        "dq_checks_failed",
+        "check_records",
+        "column_statuses",
+        "history",
+        "_counts",
+    )
+
+    data_freshness_total = _counter_property("data_freshness", COUNT_TOTAL)
+    data_freshness_pass = _counter_property("data_freshness", COUNT_PASS)
+    data_freshness_fail = _counter_property("data_freshness", COUNT_FAIL)
+    data_volume_total = _counter_property("data_volume", COUNT_TOTAL)
+    data_volume_pass = _counter_property("data_volume", COUNT_PASS)
+    data_volume_fail = _counter_property("data_volume", COUNT_FAIL)
+    missing_data_total = _counter_property("missing_data", COUNT_TOTAL)
+    missing_data_pass = _counter_property("missing_data", COUNT_PASS)
+    missing_data_fail = _counter_property("missing_data", COUNT_FAIL)
+    anomaly_total = _counter_property("anomaly", COUNT_TOTAL)
+    anomaly_pass = _counter_property("anomaly", COUNT_PASS)
+    anomaly_fail = _counter_property("anomaly", COUNT_FAIL)
+    metric_total = _counter_property("metric", COUNT_TOTAL)
+    metric_pass = _counter_property("metric", COUNT_PASS)
+    metric_fail = _counter_property("metric", COUNT_FAIL)
+    rule_total = _counter_property("rule", COUNT_TOTAL)
+    rule_pass = _counter_property("rule", COUNT_PASS)
+    rule_fail = _counter_property("rule", COUNT_FAIL)
+
+    def __init__(
+        self,
+        api_client,
+        table,
+        warehouse_id=None,
+        job_id=None,
+        run_result=None,
+        table_url=None,
+        profile_images=None,
+    ):
+        """Finds the most recent (as of yesterday) check job run for the table, unless `job_id` is given, and computes DQ summary statistics for that job run
+
+        Pass the job's `run_result`, the table's Anomalo `table_url` and `profile_images` if they have already been fetched, see `AnomaloClient.get_table_summary()`.
+        """
         self.api_client = api_client
+        # set by catalog adapters to the catalog's identifier for the table once it has been resolved
+        self.catalog_asset_id = None
+        # AnomaloCheckRecord of each check, if requested from `AnomaloClient.get_table_summary()`
+        self.check_records = None
+        # AnomaloColumnStatus by column name, if requested from `AnomaloClient.get_table_summary()`
+        self.column_statuses = None
+        # AnomaloCheckHistory of the table's recent check runs, if requested with `--history-days`
+        self.history = None
 
-        self.table = table
         self.table_id = table["table"]["id"]
         self.table_full_name = table["table"]["full_name"]
 
-        self.table_passed = False
-        self.to_checks_failed = False
-        self.dq_checks_failed = False
-
-        self.data_freshness_total = 0
-        self.data_freshness_pass = 0
-        self.data_freshness_fail = 0
-        self.data_volume_total = 0
-        self.data_volume_pass = 0
-        self.data_volume_fail = 0
-        self.missing_data_total = 0
-        self.missing_data_pass = 0
-        self.missing_data_fail = 0
-        self.anomaly_total = 0
-        self.anomaly_pass = 0
-        self.anomaly_fail = 0
-        self.metric_total = 0
-        self.metric_pass = 0
-        self.metric_fail = 0
-        self.rule_total = 0
-        self.rule_pass = 0
-        self.rule_fail = 0
-
         self.table_profile_img = None
         self.table_columns_img = None
-        if warehouse_id:
+        if profile_images:
+            self.table_profile_img, self.table_columns_img = profile_images
+        elif warehouse_id:
             try:
                 profile_resp = self.api_client.get_table_profile(
                     warehouse_id=warehouse_id, table_id=self.table_id
@@ -100,150 +623,142 @@ class AnomaloTableSummary:
                 self.table_profile_img = profile_resp.get("profile", {}).get("img_url")
                 self.table_columns_img = profile_resp.get("columns", {}).get("img_url")
             except anomalo.result.BadRequestException as e:
-                full_name = self.table["table"]["full_name"]
-                print(f"WARNING cannot fetch table profile for {full_name}: {e}")
-
-        self.job_date = (date.today() - timedelta(1)).strftime("%Y-%m-%d")
+                print(
+                    f"WARNING cannot fetch table profile for {self.table_full_name}: {e}"
+                )
 
-        res = self.api_client.get_check_intervals(
-            table_id=self.table_id, start=self.job_date, end=None
-        )
-        if res and len(res):
-            self.job_id = res[0]["latest_run_checks_job_id"]
+        self.job_id = job_id
+        if self.job_id is None and run_result is None:
+            job_date = (date.today() - timedelta(1)).strftime("%Y-%m-%d")
+            res = self.api_client.get_check_intervals(
+                table_id=self.table_id, start=job_date, end=None
+            )
+            if res and len(res):
+                self.job_id = res[0]["latest_run_checks_job_id"]
+        if run_result is not None:
+            results = run_result
+        elif self.job_id is not None:
             results = self.api_client.get_run_result(job_id=self.job_id)
         else:
             results = {}
 
-        # ANOMALO_FQN = table['table']['full_name']
-        # ANOMALO_TABLE_ID = table['table']['id']
-        # ANOMALO_WH_ID = table["table"]["warehouse_id"]
-
         # calculate DQ summary statistics
-        for r in results.get("check_runs", []):
-            # TO check types
-            if r["run_config"]["_metadata"]["check_type"] == "data_freshness":
-                self.data_freshness_total += 1
-                if r["results"]["success"] == False:
-                    self.data_freshness_fail += 1
-                    self.to_checks_failed = True
-                elif r["results"]["success"] == True:
-                    self.data_freshness_pass += 1
-            if r["run_config"]["_metadata"]["check_type"] == "data_volume":
-                self.data_volume_total += 1
-                if r["results"]["success"] == False:
-                    self.data_volume_fail += 1
-                    self.to_checks_failed = True
-                elif r["results"]["success"] == True:
-                    self.data_volume_pass += 1
-            # DQ check types
-            if r["run_config"]["_metadata"]["check_type"] == "missing_data":
-                self.missing_data_total += 1
-                if r["results"]["success"] == False:
-                    self.missing_data_fail += 1
-                    self.dq_checks_failed = True
-                elif r["results"]["success"] == True:
-                    self.missing_data_pass += 1
-            if r["run_config"]["_metadata"]["check_type"] == "anomaly":
-                self.anomaly_total += 1
-                if r["results"]["success"] == False:
-                    self.anomaly_fail += 1
-                    self.dq_checks_failed = True
-                elif r["results"]["success"] == True:
-                    self.anomaly_pass += 1
-            if r["run_config"]["_metadata"]["check_type"] == "metric":
-                self.metric_total += 1
-                if r["results"]["success"] == False:
-                    self.metric_fail += 1
-                    self.dq_checks_failed = True
-                elif r["results"]["success"] == True:
-                    self.metric_pass += 1
-            if r["run_config"]["_metadata"]["check_type"] == "rule":
-                self.rule_total += 1
-                if r["results"]["success"] == False:
-                    self.rule_fail += 1
-                    self.dq_checks_failed = True
-                elif r["results"]["success"] == True:
-                    self.rule_pass += 1
-
-        self.table_passed = (
-            self.data_freshness_total == self.data_freshness_pass
-            and self.data_volume_total == self.data_volume_pass
-            and self.missing_data_total == self.missing_data_pass
-            and self.anomaly_total == self.anomaly_pass
-            and self.metric_total == self.metric_pass
-            and self.rule_total == self.rule_pass
+        self._counts, self.to_checks_failed, self.dq_checks_failed = (
+            aggregate_check_runs(results.get("check_runs", []))
         )
 
-        org_id = self.api_client.get_active_organization_id()
-        self.anomalo_table_url = f"{self.api_client.proto}://{self.api_client.host}/dashboard/orgs/{org_id}/tables/{str(self.table_id)}"
+        self.anomalo_table_url = table_url
+        if self.anomalo_table_url is None:
+            org_id = self.api_client.get_active_organization_id()
+            self.anomalo_table_url = f"{self.api_client.proto}://{self.api_client.host}/dashboard/orgs/{org_id}/tables/{str(self.table_id)}"
 
-        # pre-generate summary statistic descriptions
-        self.results = [
-            AnomaloCheckResult(
-                "Data Freshness",
-                self.data_freshness_total,
-                self.data_freshness_pass,
-                self.data_freshness_fail,
-                False,
-            ),
-            AnomaloCheckResult(
-                "Data Volume",
-                self.data_volume_total,
-                self.data_volume_pass,
-                self.data_volume_fail,
-                self.data_freshness_pass == 0,
-            ),
-            AnomaloCheckResult(
-                "Missing Data",
-                self.missing_data_total,
-                self.missing_data_pass,
-                self.missing_data_fail,
-                self.to_checks_failed,
-            ),
-            AnomaloCheckResult(
-                "Table Anomalies",
-                self.anomaly_total,
-                self.anomaly_pass,
-                self.anomaly_fail,
-                self.to_checks_failed,
-            ),
-            AnomaloCheckResult(
-                "Key Metrics",
-                self.metric_total,
-                self.metric_pass,
-                self.metric_fail,
-                self.to_checks_failed,
-            ),
+    def _count(self, category: str, counter: int) -> int:
+        return self._counts[CHECK_CATEGORY_INDEX[category] * COUNTERS_PER_CATEGORY + counter]
+
+    @property
+    def table_passed(self) -> bool:
+        counts = self._counts
+        return all(
+            counts[offset + COUNT_TOTAL] == counts[offset + COUNT_PASS]
+            for offset in range(0, len(counts), COUNTERS_PER_CATEGORY)
+        )
+
+    @property
+    def checks_total(self) -> int:
+        return sum(self._counts[COUNT_TOTAL::COUNTERS_PER_CATEGORY])
+
+    @property
+    def checks_failed(self) -> int:
+        return sum(self._counts[COUNT_FAIL::COUNTERS_PER_CATEGORY])
+
+    @property
+    def checks_errored(self) -> int:
+        """Number of check runs that errored without a pass/fail result"""
+        return sum(self._counts[COUNT_ERRORED::COUNTERS_PER_CATEGORY])
+
+    @property
+    def checks_skipped(self) -> int:
+        """Number of check runs that were skipped or have no result yet"""
+        return sum(self._counts[COUNT_SKIPPED::COUNTERS_PER_CATEGORY])
+
+    def get_check_counts(self) -> dict:
+        """Return `<category>_total`, `<category>_pass` and `<category>_fail` counts for each check category"""
+        counts = {}
+        for category, _, _ in CHECK_CATEGORIES:
+            counts[f"{category}_total"] = self._count(category, COUNT_TOTAL)
+            counts[f"{category}_pass"] = self._count(category, COUNT_PASS)
+            counts[f"{category}_fail"] = self._count(category, COUNT_FAIL)
+        return counts
+
+    @property
+    def results(self) -> list:
+        """AnomaloCheckResult for each check category, in display order"""
+        pending = {
+            "data_freshness": False,
+            "data_volume": self.data_freshness_pass == 0,
+        }
+        return [
             AnomaloCheckResult(
-                "Validation Rules",
-                self.rule_total,
-                self.rule_pass,
-                self.rule_fail,
-                self.to_checks_failed,
-            ),
+                display_name,
+                self._count(category, COUNT_TOTAL),
+                self._count(category, COUNT_PASS),
+                self._count(category, COUNT_FAIL),
+                pending.get(category, self.to_checks_failed),
+            )
+            for category, display_name, _ in CHECK_CATEGORIES
+            if category != OTHER_CHECK_CATEGORY
+            or self._count(category, COUNT_TOTAL)
         ]
-        self.summaries = [str(r) for r in self.results]
+
+    @property
+    def summaries(self) -> list:
+        return [str(r) for r in self.results]
+
+    def get_digest(self, *extra) -> str:
+        """Return a stable hash of everything the catalog adapters publish for this table.
+
+        Two summaries with the same digest result in identical catalog writes. Pass `extra` values
+        (e.g. adapter options) to include them in the digest.
+        """
+        content = {
+            "url": self.anomalo_table_url,
+            "status": self.get_status_text(),
+            "results": [list(r) for r in self.shape],
+            "tags_to_apply": self.get_tags_to_apply(),
+            "tags_to_remove": self.get_tags_to_remove(),
+            "table_passed": self.table_passed,
+            "table_profile_img": self.table_profile_img,
+            "table_columns_img": self.table_columns_img,
+            "extra": [str(e) for e in extra],
+        }
+        if self.check_records is not None:
+            content["checks"] = [
+                [getattr(r, field) for field in AnomaloCheckRecord.__slots__]
+                for r in self.check_records
+            ]
+        if self.column_statuses is not None:
+            content["columns"] = {
+                name: list(column.shape) for name, column in self.column_statuses.items()
+            }
+        if self.history is not None:
+            content["history"] = [self.history.history_days, list(self.history.days)]
+        return hashlib.sha256(
+            json.dumps(content, sort_keys=True).encode("utf-8")
+        ).hexdigest()
 
     def update_anomalo_definition(self, definition):
         """Update the definition string for the table in Anomalo"""
         resp = self.api_client.update_table_configuration(
-            table_id=self.table["table"]["id"], definition=definition
+            table_id=self.table_id, definition=definition
         )
 
     def get_tags_to_apply(self):
         """Return a list of tags to apply to the asset in the data catalog based on latest DQ results"""
         tags = ["ANOMALO_MONITORED"]
-        if (
-            self.data_freshness_fail
-            or self.data_volume_fail
-            or self.missing_data_fail
-            or self.anomaly_fail
-            or self.metric_fail
-            or self.rule_fail
-        ):
-            tags.append("ANOMALO_DQ_CHECKS_FAILED")
-        else:
+        if self.table_passed:
             tags.append("ANOMALO_DQ_CHECKS_PASSED")
+        else:
+            tags.append("ANOMALO_DQ_CHECKS_FAILED")
 
         # These highly granular tags are not necessary for most use cases
         # They are filtered out below where we only return tags that are defined in the ANOMALO_ASSET_TAGS list
@@ -283,6 +798,13 @@ class AnomaloTableSummary:
         applied_tags = self.get_tags_to_apply()
         return [t for t in ANOMALO_ASSET_TAGS if t not in applied_tags]
 
+    @property
+    def shape(self) -> tuple:
+        """`(name, total, passed, failed, pending)` of each check result; tables with the same shape render the same rows"""
+        return tuple(
+            (r.name, r.total, r.passed, r.failed, r.pending) for r in self.results
+        )
+
     def get_status_text(self, dialect="plaintext") -> str:
         """
         Return a summary of the DQ status of the table in one of the supported formatting 'dialects'.
@@ -295,73 +817,13 @@ class AnomaloTableSummary:
         Args:
             dialect: 'plaintext' (default), 'markdown', 'purview', 'html'
         """
-        if dialect == "markdown":
-            return self._get_status_markdown()
-        if dialect == "purview":
-            return self._get_status_purview()
-        if dialect == "html":
-            return self._get_status_html()
-
-        summaries = "\n".join(["    * " + s for s in self.summaries])
-        return f"""Anomalo Data Quality Checks
-    {self.anomalo_table_url}
-{summaries}
-======
-"""
-
-    def _get_status_html(self) -> str:
-        """Return an HTML string summarizing the DQ status of the table"""
-
-        summaries = "\n".join(
-            [
-                f'    <li class="editor-listitem" dir="ltr" value="{idx + 1}"><span style="display: block;white-space: pre-wrap;">{s}</span></li>'
-                for idx, s in enumerate(self.summaries)
-            ]
+        return self.get_status_texts(dialect)[dialect]
+
+    def get_status_texts(self, *dialects) -> dict:
+        """Return the DQ status of the table in several dialects at once, as a dict keyed by dialect; see `get_status_text()`"""
+        return render_status_text(
+            self.anomalo_table_url,
+            self.shape,
+            dialects,
+            history_text=self.history.get_status_text() if self.history else None,
         )
-
-        return f"""<!-- begin anomalo table summary -->
-<p class="editor-paragraph" dir="ltr">
-    <a class="editor-link" href="{self.anomalo_table_url}" rel="noopener noreferrer" target="_blank">
-        <span style="white-space: pre-wrap;">{self.anomalo_table_url}</span>
-    </a>
-</p>
-<ul class="editor-list-ul">
-{summaries}
-</ul><!-- end anomalo table summary -->
-    """
-
-    def _get_status_markdown(self) -> str:
-        """Return a Markdown string summarizing the DQ status of the table"""
-
-        summaries = "\n".join([f"* {s}" for s in self.summaries])
-
-        return f"""**Anomalo Data Quality Checks**
-    [View table in Anomalo]({self.anomalo_table_url})
-
-{summaries}
-    """
-
-    def _get_status_purview(self) -> str:
-        """Return an HTML string summarizing the DQ status of the table using Purview-compatible markup"""
-
-        summaries = "\n".join(
-            [
-                f"""
-            <tr>
-                <td style="width:100px; border-width:1px; border-style:solid; border-color:rgb(171, 171, 171); background-color:transparent;">{r.name}</td>
-                <td style="width:100px; border-width:1px; border-style:solid; border-color:rgb(171, 171, 171); background-color:transparent;">{r.passed}{" ✅" if r.passed > 0 and r.failed == 0 else ""}</td>
-                </td><td style="width:100px; border-width:1px; border-style:solid; border-color:rgb(171, 171, 171); background-color:transparent;">{r.failed}{" ❌" if r.failed > 0 else ""}</td>
-            </tr>"""
-                for r in self.results
-            ]
-        ).strip()
-
-        return f"""<!-- begin anomalo table summary -->
-            <div><span><a href="{self.anomalo_table_url}">{self.anomalo_table_url}</a><br></span></div>
-            <div><br></div>
-            <div><table style="border-collapse:collapse;"><tbody>
-                <tr><td style="width:100px; border-width:1px; border-style:solid; border-color:rgb(171, 171, 171); background-color:transparent;">Check</td><td style="width:100px; border-width:1px; border-style:solid; border-color:rgb(171, 171, 171); background-color:transparent;">Pass</td><td style="width:100px; border-width:1px; border-style:solid; border-color:rgb(171, 171, 171); background-color:transparent;">Fail</td></tr>
-                {summaries}
-            </tbody></table></div>
-            </ul><!-- end anomalo table summary -->
-                """
@@ -0,0 +1,129 @@
+from functools import lru_cache
+
+
+STATUS_TEXT_DIALECTS = ("plaintext", "markdown", "purview", "html")
+
+# Table cell markup repeated throughout the Purview dialect
+_PURVIEW_CELL = '<td style="width:100px; border-width:1px; border-style:solid; border-color:rgb(171, 171, 171); background-color:transparent;">'
+
+# Document templates per dialect, filled in with the table's Anomalo URL and the rendered check rows
+_DOCUMENT_TEMPLATES = {
+    "plaintext": """Anomalo Data Quality Checks
+    {url}
+{rows}{history}
+======
+""",
+    "markdown": """**Anomalo Data Quality Checks**
+    [View table in Anomalo]({url})
+
+{rows}{history}
+    """,
+    "html": """<!-- begin anomalo table summary -->
+<p class="editor-paragraph" dir="ltr">
+    <a class="editor-link" href="{url}" rel="noopener noreferrer" target="_blank">
+        <span style="white-space: pre-wrap;">{url}</span>
+    </a>
+</p>
+<ul class="editor-list-ul">
+{rows}{history}
+</ul><!-- end anomalo table summary -->
+    """,
+    "purview": f"""<!-- begin anomalo table summary -->
+            <div><span><a href="{{url}}">{{url}}</a><br></span></div>
+            <div><br></div>
+            <div><table style="border-collapse:collapse;"><tbody>
+                <tr>{_PURVIEW_CELL}Check</td>{_PURVIEW_CELL}Pass</td>{_PURVIEW_CELL}Fail</td></tr>
+                {{rows}}
+            </tbody></table></div>{{history}}
+            </ul><!-- end anomalo table summary -->
+                """,
+}
+
+# Line appended to the check rows with `--history-days`, per dialect
+_HISTORY_TEMPLATES = {
+    "plaintext": "\n    * {text}",
+    "markdown": "\n* {text}",
+    "html": '\n    <li class="editor-listitem" dir="ltr"><span style="display: block;white-space: pre-wrap;">{text}</span></li>',
+    "purview": "\n            <div><br></div>\n            <div>{text}</div>",
+}
+
+_PURVIEW_ROW_TEMPLATE = f"""
+            <tr>
+                {_PURVIEW_CELL}{{name}}</td>
+                {_PURVIEW_CELL}{{passed}}</td>
+                </td>{_PURVIEW_CELL}{{failed}}</td>
+            </tr>"""
+
+
+def _result_text(name, total, passed, failed, pending) -> str:
+    """Same as str(AnomaloCheckResult)"""
+    if pending:
+        return f"{name}: 🕑"
+    icon = "❌" if failed > 0 else "✅" if passed == total else "🕑"
+    return f"{name}: {passed}/{total} passed {icon}"
+
+
+@lru_cache(maxsize=4096)
+def _render_rows(dialect: str, shape: tuple) -> str:
+    """Render the check rows of a summary; many tables share the same shape, so these are memoized"""
+    if dialect == "purview":
+        return "\n".join(
+            _PURVIEW_ROW_TEMPLATE.format(
+                name=name,
+                passed=f"{passed}{' ✅' if passed > 0 and failed == 0 else ''}",
+                failed=f"{failed}{' ❌' if failed > 0 else ''}",
+            )
+            for name, total, passed, failed, pending in shape
+        ).strip()
+
+    texts = [_result_text(*result) for result in shape]
+    if dialect == "markdown":
+        return "\n".join(f"* {s}" for s in texts)
+    if dialect == "html":
+        return "\n".join(
+            f'    <li class="editor-listitem" dir="ltr" value="{idx + 1}"><span style="display: block;white-space: pre-wrap;">{s}</span></li>'
+            for idx, s in enumerate(texts)
+        )
+    return "\n".join("    * " + s for s in texts)
+
+
+def render_status_text(
+    url: str, shape: tuple, dialects=("plaintext",), history_text: str = None
+) -> dict:
+    """Render a table's DQ status in each of the given dialects.
+
+    Args:
+        url: the table's Anomalo URL
+        shape: `(name, total, passed, failed, pending)` for each check result, in display order
+        dialects: any of STATUS_TEXT_DIALECTS
+        history_text: optional summary of recent check runs, shown after the check rows
+    """
+    texts = {}
+    for dialect in dialects:
+        # unknown dialects are rendered as plaintext
+        template = dialect if dialect in _DOCUMENT_TEMPLATES else "plaintext"
+        history = ""
+        if history_text:
+            history = _HISTORY_TEMPLATES[template].format(text=history_text)
+        texts[dialect] = _DOCUMENT_TEMPLATES[template].format(
+            url=url, rows=_render_rows(template, shape), history=history
+        )
+    return texts
+
+
+def render_column_status_text(
+    total: int, passed: int, failed: int, failed_checks, dialect="plaintext"
+) -> str:
+    """Render a column's DQ status, e.g. `Anomalo: 3/4 checks passed ❌ (failed: Null values)`.
+
+    Column statuses are short, so the same text is used in every dialect except the HTML ones,
+    which list the failed checks.
+    """
+    icon = "❌" if failed > 0 else "✅" if passed == total else "🕑"
+    text = f"Anomalo: {passed}/{total} checks passed {icon}"
+    if dialect in ("purview", "html"):
+        items = "".join(f"<li>{name}</li>" for name in failed_checks)
+        return f"<div>{text}</div>" + (f"<ul>{items}</ul>" if items else "")
+    if failed_checks:
+        text += f" (failed: {', '.join(failed_checks)})"
+    return text
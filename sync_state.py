@@ -0,0 +1,192 @@
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+
+DEFAULT_SYNC_STATE_FILE = "anomalo-catalog-state.db"
+
+
+class SyncStateStore:
+    """Local SQLite record of what was last published to the catalog for each table.
+
+    Rows are keyed by catalog, Anomalo organization id, warehouse id and table id.
+    The store also caches per-day check run aggregates of each table for `--history-days`.
+    The store is safe to use from multiple worker threads.
+    """
+
+    def __init__(self, path: str, catalog: str, organization_id):
+        self.path = path
+        self._catalog = catalog
+        self._organization_id = organization_id
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS table_sync_state (
+                    catalog TEXT NOT NULL,
+                    organization_id INTEGER NOT NULL,
+                    warehouse_id INTEGER NOT NULL,
+                    table_id INTEGER NOT NULL,
+                    digest TEXT,
+                    synced_at TEXT,
+                    job_id INTEGER,
+                    catalog_asset_id TEXT,
+                    options_digest TEXT,
+                    PRIMARY KEY (catalog, organization_id, warehouse_id, table_id)
+                )"""
+            )
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS catalog_cache (
+                    catalog TEXT NOT NULL,
+                    organization_id INTEGER NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT,
+                    updated_at TEXT,
+                    PRIMARY KEY (catalog, organization_id, key)
+                )"""
+            )
+            # per-day check run aggregates for `--history-days`; these only depend on Anomalo, not the catalog
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS check_history (
+                    organization_id INTEGER NOT NULL,
+                    table_id INTEGER NOT NULL,
+                    day TEXT NOT NULL,
+                    job_id INTEGER NOT NULL,
+                    checks_total INTEGER NOT NULL,
+                    checks_failed INTEGER NOT NULL,
+                    fetched_at TEXT,
+                    PRIMARY KEY (organization_id, table_id, day)
+                )"""
+            )
+            self._db.commit()
+
+    def get(self, warehouse_id, table_id) -> dict:
+        """Return the stored state for a table, or None if it has never been synced"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM table_sync_state WHERE catalog = ? AND organization_id = ? AND warehouse_id = ? AND table_id = ?",
+                (self._catalog, self._organization_id, warehouse_id, table_id),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def record(
+        self,
+        warehouse_id,
+        table_id,
+        digest: str,
+        job_id=None,
+        catalog_asset_id: str = None,
+        options_digest: str = None,
+    ):
+        """Record a successful sync of a table; call `commit()` to persist it.
+
+        Args:
+            digest: digest of the DQ status published to the catalog
+            job_id: Anomalo check run job that the published status came from
+            catalog_asset_id: the catalog's identifier for the table, e.g. Purview GUID or Dataplex entry name
+            options_digest: digest of the sync options in effect
+        """
+        with self._lock:
+            self._db.execute(
+                """INSERT INTO table_sync_state (catalog, organization_id, warehouse_id, table_id,
+                    digest, synced_at, job_id, catalog_asset_id, options_digest)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (catalog, organization_id, warehouse_id, table_id)
+                DO UPDATE SET digest = excluded.digest, synced_at = excluded.synced_at, job_id = excluded.job_id,
+                    catalog_asset_id = COALESCE(excluded.catalog_asset_id, catalog_asset_id),
+                    options_digest = excluded.options_digest""",
+                (
+                    self._catalog,
+                    self._organization_id,
+                    warehouse_id,
+                    table_id,
+                    digest,
+                    datetime.now(timezone.utc).isoformat(),
+                    job_id,
+                    catalog_asset_id,
+                    options_digest,
+                ),
+            )
+
+    def get_cached(self, key: str) -> str:
+        """Return a value cached by the catalog adapter in a previous run, or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM catalog_cache WHERE catalog = ? AND organization_id = ? AND key = ?",
+                (self._catalog, self._organization_id, key),
+            ).fetchone()
+        return row["value"] if row else None
+
+    def set_cached(self, key: str, value: str):
+        """Cache a value for the catalog adapter across runs, e.g. catalog objects it has created"""
+        with self._lock:
+            self._db.execute(
+                """INSERT INTO catalog_cache (catalog, organization_id, key, value, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (catalog, organization_id, key)
+                DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at""",
+                (
+                    self._catalog,
+                    self._organization_id,
+                    key,
+                    value,
+                    datetime.now(timezone.utc).isoformat(),
+                ),
+            )
+
+    def delete_cached(self, key: str):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM catalog_cache WHERE catalog = ? AND organization_id = ? AND key = ?",
+                (self._catalog, self._organization_id, key),
+            )
+
+    def get_history(self, table_id, since: str) -> dict:
+        """Return the check run aggregates recorded for a table from day `since` (YYYY-MM-DD) on, by day"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT day, job_id, checks_total, checks_failed FROM check_history WHERE organization_id = ? AND table_id = ? AND day >= ?",
+                (self._organization_id, table_id, since),
+            ).fetchall()
+        return {row["day"]: dict(row) for row in rows}
+
+    def record_history(
+        self, table_id, day: str, job_id, checks_total: int, checks_failed: int
+    ):
+        """Record the aggregates of a table's latest check run job on a day; call `commit()` to persist them"""
+        with self._lock:
+            self._db.execute(
+                """INSERT INTO check_history (organization_id, table_id, day, job_id, checks_total, checks_failed, fetched_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (organization_id, table_id, day)
+                DO UPDATE SET job_id = excluded.job_id, checks_total = excluded.checks_total,
+                    checks_failed = excluded.checks_failed, fetched_at = excluded.fetched_at""",
+                (
+                    self._organization_id,
+                    table_id,
+                    day,
+                    job_id,
+                    checks_total,
+                    checks_failed,
+                    datetime.now(timezone.utc).isoformat(),
+                ),
+            )
+
+    def prune_history(self, before: str):
+        """Forget check run aggregates of days before `before` (YYYY-MM-DD)"""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM check_history WHERE organization_id = ? AND day < ?",
+                (self._organization_id, before),
+            )
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
@@ -0,0 +1,415 @@
+"""Minimal local stand-in for the Collibra REST 2.0 API, for trying the collibra adapter without a Collibra instance.
+
+Serves the endpoints the adapter uses (asset, attribute and relation types, assignments,
+domains, assets, bulk JSON import jobs and job status) from memory, seeded with Table assets.
+Like Collibra, imports fail if they set an attribute or relation that is not assigned to
+the asset's type.
+
+    python tools/collibra_mock_server.py --port 8088 --tables sales.orders,sales.customers
+
+    COLLIBRA_HOSTNAME=http://localhost:8088 COLLIBRA_USER=admin COLLIBRA_PASSWORD=admin \\
+        python anomalo-catalog.py --catalog collibra
+
+GET /mock/state returns everything that was created or imported.
+"""
+
+import argparse
+import base64
+import email
+import email.policy
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class CollibraState:
+    def __init__(self, tables, community="Anomalo Mock", job_seconds=0.5):
+        self.lock = threading.Lock()
+        self.job_seconds = job_seconds
+        self.asset_types = {}
+        self.attribute_types = {}
+        self.relation_types = {}
+        self.assignments = {}
+        self.domains = {}
+        self.assets = {}
+        self.jobs = {}
+        self.imports = []
+
+        for public_id, name in (("Table", "Table"), ("DataQualityRule", "Data Quality Rule")):
+            asset_type = self._add(self.asset_types, {"name": name, "publicId": public_id})
+            self._add(
+                self.assignments,
+                {
+                    "assetType": {"id": asset_type["id"], "name": name},
+                    "statuses": [{"id": "candidate", "name": "Candidate"}],
+                    "characteristicTypes": [],
+                },
+            )
+        table_type = self.asset_type_by_public_id("Table")
+        for full_name in tables:
+            schema, _, table = full_name.rpartition(".")
+            domain = self.domain_named(schema or "default", community)
+            self._add(
+                self.assets,
+                {
+                    "name": full_name,
+                    "displayName": table,
+                    "domain": {"id": domain["id"], "name": domain["name"]},
+                    "type": {"id": table_type["id"], "name": table_type["name"]},
+                    "attributes": {},
+                },
+            )
+
+    @staticmethod
+    def _add(collection, resource):
+        resource = dict(resource, id=str(uuid.uuid4()))
+        collection[resource["id"]] = resource
+        return resource
+
+    def asset_type_by_public_id(self, public_id):
+        for t in self.asset_types.values():
+            if t["publicId"] == public_id:
+                return t
+        return None
+
+    def assignments_of(self, asset_type_id):
+        """The asset type's assignments, or its nearest ancestor's"""
+        while asset_type_id:
+            own = [
+                a for a in self.assignments.values() if a["assetType"]["id"] == asset_type_id
+            ]
+            if own:
+                return own
+            asset_type_id = self.asset_types[asset_type_id].get("parentId")
+        return []
+
+    def is_assigned(self, asset_type_id, characteristic_id):
+        return any(
+            c["id"] == characteristic_id
+            for a in self.assignments_of(asset_type_id)
+            for c in a["characteristicTypes"]
+        )
+
+    def domain_named(self, name, community):
+        for d in self.domains.values():
+            if d["name"] == name and d["community"]["name"] == community:
+                return d
+        return self._add(
+            self.domains,
+            {"name": name, "community": {"id": str(uuid.uuid4()), "name": community}},
+        )
+
+    def import_rows(self, rows):
+        """Apply import rows; returns an error message, or None if every row was imported"""
+        self.imports.append(rows)
+        for row in rows:
+            ident = row["identifier"]
+            domain = self.domain_named(
+                ident["domain"]["name"], ident["domain"]["community"]["name"]
+            )
+            asset = next(
+                (
+                    a
+                    for a in self.assets.values()
+                    if a["name"] == ident["name"] and a["domain"]["id"] == domain["id"]
+                ),
+                None,
+            )
+            if asset is None:
+                type_name = row.get("type", {}).get("name")
+                asset_type = next(
+                    (t for t in self.asset_types.values() if t["name"] == type_name), None
+                )
+                if asset_type is None:
+                    return f"Unknown asset {ident['name']} and no valid type to create it"
+                asset = self._add(
+                    self.assets,
+                    {
+                        "name": ident["name"],
+                        "displayName": row.get("displayName", ident["name"]),
+                        "domain": {"id": domain["id"], "name": domain["name"]},
+                        "type": {"id": asset_type["id"], "name": asset_type["name"]},
+                        "attributes": {},
+                    },
+                )
+            for name, values in row.get("attributes", {}).items():
+                attribute_type = next(
+                    (t for t in self.attribute_types.values() if t["name"] == name), None
+                )
+                if attribute_type is None:
+                    return f"Unknown attribute type {name}"
+                if not self.is_assigned(asset["type"]["id"], attribute_type["id"]):
+                    return f"Attribute type {name} is not assigned to {asset['type']['name']}"
+                asset["attributes"][name] = [v["value"] for v in values]
+            for relation, targets in row.get("relations", {}).items():
+                relation_type = self.relation_types.get(relation.split(":")[0])
+                if relation_type is None:
+                    return f"Unknown relation type {relation}"
+                if not self.is_assigned(relation_type["sourceTypeId"], relation_type["id"]):
+                    return f"Relation type {relation_type['role']} is not assigned to its source type"
+                asset.setdefault("relations", {})[relation] = targets
+        return None
+
+
+def make_handler(state: CollibraState, user: str, password: str):
+    expected_auth = "Basic " + base64.b64encode(f"{user}:{password}".encode()).decode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body=None):
+            payload = json.dumps(body if body is not None else {}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _page(self, results, query):
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", ["1000"])[0])
+            self._send(
+                200,
+                {
+                    "total": len(results),
+                    "offset": offset,
+                    "limit": limit,
+                    "results": results[offset : offset + limit],
+                },
+            )
+
+        @staticmethod
+        def _named(resources, query):
+            name = query.get("name", [None])[0]
+            mode = query.get("nameMatchMode", ["ANYWHERE"])[0]
+            if name is None:
+                return list(resources)
+            match = {
+                "EXACT": lambda n: n == name,
+                "START": lambda n: n.startswith(name),
+                "END": lambda n: n.endswith(name),
+            }.get(mode, lambda n: name in n)
+            return [r for r in resources if match(r["name"])]
+
+        def _authorized(self):
+            if self.headers.get("Authorization") == expected_auth:
+                return True
+            self._send(401, {"errorMessage": "Unauthorized"})
+            return False
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            parts = url.path.rstrip("/").split("/")
+            with state.lock:
+                if url.path == "/mock/state":
+                    return self._send(
+                        200,
+                        {
+                            name: list(getattr(state, name).values())
+                            for name in (
+                                "asset_types",
+                                "attribute_types",
+                                "relation_types",
+                                "assignments",
+                                "domains",
+                                "assets",
+                                "jobs",
+                            )
+                        },
+                    )
+                if url.path.startswith("/rest/2.0/assetTypes/publicId/"):
+                    asset_type = state.asset_type_by_public_id(parts[-1])
+                    return self._send(200 if asset_type else 404, asset_type)
+                if url.path == "/rest/2.0/assetTypes":
+                    return self._page(self._named(state.asset_types.values(), query), query)
+                if url.path == "/rest/2.0/attributeTypes":
+                    return self._page(self._named(state.attribute_types.values(), query), query)
+                if url.path == "/rest/2.0/relationTypes":
+                    results = [
+                        r
+                        for r in state.relation_types.values()
+                        if all(
+                            r.get(k) == query[k][0]
+                            for k in ("sourceTypeId", "targetTypeId", "role")
+                            if k in query
+                        )
+                    ]
+                    return self._page(results, query)
+                if url.path.startswith("/rest/2.0/assignments/assetType/"):
+                    if parts[-1] not in state.asset_types:
+                        return self._send(404, {"errorMessage": "Unknown asset type"})
+                    return self._send(200, state.assignments_of(parts[-1]))
+                if url.path == "/rest/2.0/domains":
+                    return self._page(list(state.domains.values()), query)
+                if url.path.startswith("/rest/2.0/domains/"):
+                    domain = state.domains.get(parts[-1])
+                    return self._send(200 if domain else 404, domain)
+                if url.path == "/rest/2.0/assets":
+                    results = self._named(state.assets.values(), query)
+                    if "typePublicIds" in query:
+                        type_ids = {
+                            state.asset_type_by_public_id(p)["id"]
+                            for p in query["typePublicIds"]
+                        }
+                        results = [a for a in results if a["type"]["id"] in type_ids]
+                    if "typeIds" in query:
+                        results = [a for a in results if a["type"]["id"] in query["typeIds"]]
+                    if "domainId" in query:
+                        results = [
+                            a for a in results if a["domain"]["id"] == query["domainId"][0]
+                        ]
+                    return self._page(results, query)
+                if url.path.startswith("/rest/2.0/assets/"):
+                    asset = state.assets.get(parts[-1])
+                    return self._send(200 if asset else 404, asset)
+                if url.path.startswith("/rest/2.0/jobs/"):
+                    job = state.jobs.get(parts[-1])
+                    if (
+                        job
+                        and job["state"] == "RUNNING"
+                        and time.monotonic() >= job["_done_at"]
+                    ):
+                        error = state.import_rows(job.pop("_rows"))
+                        job.update(
+                            state="COMPLETED" if error is None else "ERROR",
+                            result="SUCCESS" if error is None else "FAILURE",
+                            message=error,
+                        )
+                    return self._send(
+                        200 if job else 404,
+                        {k: v for k, v in (job or {}).items() if not k.startswith("_")},
+                    )
+            self._send(404, {"errorMessage": f"Not found: {url.path}"})
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            url = urlparse(self.path)
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with state.lock:
+                if url.path == "/rest/2.0/import/json-job":
+                    message = email.message_from_bytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body,
+                        policy=email.policy.HTTP,
+                    )
+                    files = [
+                        part.get_content()
+                        for part in message.iter_parts()
+                        if part.get_param("name", header="content-disposition") == "file"
+                    ]
+                    if not files:
+                        return self._send(400, {"errorMessage": "Missing file"})
+                    content = files[0]
+                    rows = json.loads(content if isinstance(content, str) else content.decode())
+                    job = state._add(
+                        state.jobs,
+                        {
+                            "type": "IMPORT",
+                            "state": "RUNNING",
+                            "_rows": rows,
+                            "_done_at": time.monotonic() + state.job_seconds,
+                        },
+                    )
+                    return self._send(200, {"id": job["id"], "state": "RUNNING"})
+
+                collections = {
+                    "/rest/2.0/assetTypes": state.asset_types,
+                    "/rest/2.0/attributeTypes": state.attribute_types,
+                    "/rest/2.0/relationTypes": state.relation_types,
+                }
+                if url.path in collections:
+                    resource = json.loads(body)
+                    if url.path == "/rest/2.0/assetTypes":
+                        resource.setdefault("publicId", resource["name"].replace(" ", ""))
+                    return self._send(201, state._add(collections[url.path], resource))
+                if url.path == "/rest/2.0/assignments":
+                    request = json.loads(body)
+                    asset_type = state.asset_types.get(request["assetTypeId"])
+                    if asset_type is None:
+                        return self._send(404, {"errorMessage": "Unknown asset type"})
+                    assignment = state._add(
+                        state.assignments,
+                        {
+                            "assetType": {"id": asset_type["id"], "name": asset_type["name"]},
+                            "statuses": [{"id": i} for i in request.get("statusIds", [])],
+                            "characteristicTypes": request.get("characteristicTypes", []),
+                        },
+                    )
+                    return self._send(201, assignment)
+            self._send(404, {"errorMessage": f"Not found: {url.path}"})
+
+        def do_PATCH(self):
+            if not self._authorized():
+                return
+            url = urlparse(self.path)
+            parts = url.path.rstrip("/").split("/")
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with state.lock:
+                if url.path.startswith("/rest/2.0/assignments/"):
+                    assignment = state.assignments.get(parts[-1])
+                    if assignment is None:
+                        return self._send(404, {"errorMessage": "Unknown assignment"})
+                    assignment.update(json.loads(body))
+                    return self._send(200, assignment)
+            self._send(404, {"errorMessage": f"Not found: {url.path}"})
+
+        def do_DELETE(self):
+            if not self._authorized():
+                return
+            url = urlparse(self.path)
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with state.lock:
+                if url.path == "/rest/2.0/assets/bulk":
+                    asset_ids = json.loads(body)
+                    if any(i not in state.assets for i in asset_ids):
+                        return self._send(404, {"errorMessage": "Unknown asset"})
+                    # an asset's relations are stored on it, so they are deleted with it
+                    for asset_id in asset_ids:
+                        del state.assets[asset_id]
+                    return self._send(200, {})
+            self._send(404, {"errorMessage": f"Not found: {url.path}"})
+
+        def log_message(self, format, *args):
+            print(f"{self.command} {self.path} -> {args[1] if len(args) > 1 else ''}")
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--user", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument(
+        "--tables",
+        default="",
+        help="Comma-separated <schema>.<table> names to create as Table assets",
+    )
+    parser.add_argument(
+        "--job-seconds",
+        type=float,
+        default=0.5,
+        help="How long import jobs stay RUNNING before they complete",
+    )
+    args = parser.parse_args()
+
+    state = CollibraState(
+        [t.strip() for t in args.tables.split(",") if t.strip()],
+        job_seconds=args.job_seconds,
+    )
+    server = ThreadingHTTPServer(
+        ("localhost", args.port), make_handler(state, args.user, args.password)
+    )
+    print(f"Mock Collibra API listening on http://localhost:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()